@@ -1,27 +1,257 @@
-from flask import Flask, request
+import os
+import json
+import logging
+from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
-from globals import conn 
+import click
+import logs
+from metrics import request_metrics, pool_collector, stats_collector
+from query_stats import query_stats
+from profiling import request_profiler
+from decorators import operator_required, profile_token_required
+from globals import pool, release_conn, storage
+import rollups
+from response_cache import response_cache
+from outbox import outbox_sender
+from passwords import password_hasher, user_attempts, ip_attempts
+from token_cache import revoked_tokens, fetch_revoked_tokens, purge_expired_revocations, start_revocation_purger, migrate_legacy_blacklist
 
 from blueprints.salaries.salaries import salaries_bp
 from blueprints.expenses.expenses import expense_bp
 from blueprints.saving_goals.saving_Goals import saving_bp
 from blueprints.auth.auth import auth_bp
 from blueprints.graphs.graphs_expenses import expense_graph_bp
-from blueprints.ML.forecast_api import ml_bp
+from blueprints.ML.forecast_api import ml_bp, registry as model_registry, predict_all, fetch_series_rows
+from blueprints.ML.timeseries import forecast_users, MAX_HORIZON
 from blueprints.totalsalaries.totalsalaries import totals_bp
-from blueprints.budget.budget import budget_bp
+from blueprints.budget.budget import budget_bp, reconcile_budgets
+from blueprints.dashboard.dashboard import dashboard_bp
+
+logs.configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor", "Link", "ETag", "X-Profile-Id"])
 
 app.config['SECRET_KEY'] = 'mysecret'
+# Set ACCESS_TOKEN_MINUTES low (e.g. 15) together with REFRESH_TOKEN_DAYS to use short-lived access tokens
+app.config['ACCESS_TOKEN_MINUTES'] = int(os.environ.get('ACCESS_TOKEN_MINUTES', 6000))
+app.config['REFRESH_TOKEN_DAYS'] = int(os.environ.get('REFRESH_TOKEN_DAYS', 0))
+app.config['REVOCATION_PURGE_SECONDS'] = int(os.environ.get('REVOCATION_PURGE_SECONDS', 3600))
+# 0 disables the periodic account_balances consistency check
+app.config['BALANCE_CHECK_SECONDS'] = int(os.environ.get('BALANCE_CHECK_SECONDS', 3600))
+# Set OUTBOX_SENDER=0 when a separate `flask send-outbox` process delivers the email outbox
+app.config['OUTBOX_SENDER'] = os.environ.get('OUTBOX_SENDER', '1') == '1'
+# Shared secret for the operator stats and model routes (X-Operator-Token); unset closes them
+app.config['OPERATOR_TOKEN'] = os.environ.get('OPERATOR_TOKEN') or None
+
+request_metrics.init_app(app)
+request_metrics.add_collector(pool_collector(pool))
+request_metrics.add_collector(query_stats.collect)
+request_metrics.add_collector(stats_collector(
+    'response_cache', response_cache.stats,
+    counters=('hits', 'misses', 'stale', 'expired', 'evictions'), gauges=('size',)
+))
+request_metrics.add_collector(stats_collector(
+    'password_hashing', password_hasher.stats, counters=('completed', 'rejected'), gauges=('in_flight',)
+))
+request_metrics.add_collector(lambda: [
+    ('log_records_dropped_total', 'counter', 'Log records dropped because the log queue was full.', [({}, logs.dropped_records())]),
+])
+
+request_profiler.init_app(app)
+
+app.before_request(logs.start_request)
+app.after_request(logs.log_response)
+
+app.teardown_appcontext(release_conn)
+
+if storage.embedded:
+    with pool.connection() as conn:
+        storage.bootstrap(conn, seed=True)
+        cursor = conn.cursor()
+        cursor.execute("SELECT (SELECT COUNT(*) FROM monthly_rollups), (SELECT COUNT(*) FROM account_balances)")
+        if 0 in cursor.fetchone():
+            rollups.rebuild(conn)
+
+try:
+    with pool.connection() as conn:
+        migrate_legacy_blacklist(conn, storage.IntegrityError)
+        revoked_tokens.load(fetch_revoked_tokens(conn))
+except Exception as e:
+    logger.warning("Could not preload token blacklist, loading on first request: %s", e)
+
+start_revocation_purger(pool, app.config['REVOCATION_PURGE_SECONDS'])
+# Load the forecast model at startup (reporting load time and RSS) instead of on the first prediction
+if os.environ.get('MODEL_PRELOAD', '0') == '1':
+    try:
+        model_registry.get()
+    except Exception as e:
+        logger.warning("Forecast model not preloaded: %s", e)
+
+if app.config['BALANCE_CHECK_SECONDS']:
+    rollups.start_balance_checker(pool, app.config['BALANCE_CHECK_SECONDS'])
+
+if app.config['OUTBOX_SENDER']:
+    outbox_sender.start()
+
+@app.cli.command('init-db')
+@click.option('--seed/--no-seed', default=False, help='Load backend/Database/*.csv into empty tables.')
+def init_db(seed):
+    """Create the schema for the configured DB_BACKEND"""
+    with pool.connection() as conn:
+        storage.bootstrap(conn, seed=seed)
+        migrated = migrate_legacy_blacklist(conn, storage.IntegrityError)
+        if seed:
+            rollups.rebuild(conn)
+    click.echo(f"Schema ready on {storage.name}" + (f", {migrated} legacy blacklisted tokens migrated" if migrated else ""))
+
+@app.cli.command('purge-revoked-tokens')
+def purge_revoked_tokens():
+    """Delete revoked token ids whose tokens have already expired"""
+    with pool.connection() as conn:
+        click.echo(f"Purged {purge_expired_revocations(conn)} expired revocations")
+
+@app.cli.command('reconcile-budgets')
+def reconcile_budgets_command():
+    """Recompute budgets.used_amount for every user from expenses"""
+    with pool.connection() as conn:
+        click.echo(f"Reconciled {reconcile_budgets(conn)} budgets")
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups():
+    """Regenerate monthly_rollups and account_balances from expenses, salaries and saving_goals"""
+    with pool.connection() as conn:
+        click.echo(f"Rebuilt {rollups.rebuild(conn)} monthly rollup rows")
+
+@app.cli.command('check-balances')
+@click.option('--repair/--no-repair', default=False, help='Overwrite drifted balances with the recomputed totals.')
+def check_balances(repair):
+    """Compare account_balances with totals recomputed from the base tables"""
+    with pool.connection() as conn:
+        mismatches = rollups.check_balances(conn, repair=repair)
+    for username, stored, actual in mismatches:
+        click.echo(f"{username}: stored {stored}, recomputed {actual}")
+    click.echo(f"{len(mismatches)} balances out of step" + (" (repaired)" if repair and mismatches else ""))
+
+@app.cli.command('train-model')
+@click.option('--incremental/--full', default=False, help='Only fit the months completed since the current model.')
+def train_model_command(incremental):
+    """Train the forecast model now and make it the current version"""
+    try:
+        metadata = model_registry.train(incremental)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        f"Model {metadata['version']} ({metadata['mode']}) trained on {metadata['training_rows']} rows "
+        f"in {metadata['training_seconds']}s"
+        + (f", peak RSS while training {metadata['peak_memory_bytes'] / 2**20:.1f} MiB" if metadata['peak_memory_bytes'] else "")
+    )
+
+@app.cli.command('predict-all')
+@click.argument('usernames', nargs=-1)
+def predict_all_command(usernames):
+    """Precompute next-month forecasts for every user (or the given ones) into predictions"""
+    with pool.connection() as conn:
+        click.echo(f"Stored {predict_all(conn, list(usernames) or None)} predictions")
+
+@app.cli.command('forecast-categories')
+@click.option('--horizon', default=3, type=click.IntRange(1, MAX_HORIZON), help='Months to project.')
+@click.argument('usernames', nargs=-1)
+def forecast_categories_command(horizon, usernames):
+    """Print per-category forecasts for every user (or the given ones) as JSON lines"""
+    with pool.connection() as conn:
+        forecasts = forecast_users(fetch_series_rows(conn.cursor(), list(usernames) or None), horizon)
+    for username, forecast in forecasts.items():
+        click.echo(json.dumps(dict(forecast, username=username)))
+
+@app.cli.command('send-outbox')
+@click.option('--once', is_flag=True, help='Send what is due and exit instead of polling.')
+def send_outbox_command(once):
+    """Deliver queued emails from email_outbox"""
+    if once:
+        sent = 0
+        while True:
+            claimed = outbox_sender.send_due()
+            sent += claimed
+            if claimed < outbox_sender.batch_size:
+                break
+        outbox_sender.stop()
+        click.echo(json.dumps(dict(outbox_sender.stats(), claimed=sent)))
+        return
+    outbox_sender.start().join()
+
+@app.cli.command('explain')
+@click.argument('sql')
+@click.argument('params', nargs=-1)
+def explain(sql, params):
+    """Print the query plan of SQL on the configured DB_BACKEND"""
+    with pool.connection() as conn:
+        for line in storage.explain(conn, sql, params):
+            click.echo(line)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return app.response_class(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 200 only while the database answers within READY_TIMEOUT seconds"""
+    try:
+        pool.ping(timeout=float(os.environ.get('READY_TIMEOUT', 2)))
+    except Exception as e:
+        logger.warning("Readiness check failed: %s", e)
+        return jsonify({"status": "unavailable", "database": str(e)}), 503
+    return jsonify({"status": "ready"}), 200
+
+@app.route('/api/v1.0/sql-stats', methods=['GET'])
+@operator_required
+def sql_stats():
+    order = request.args.get('order', 'total_seconds')
+    if order not in ('total_seconds', 'calls', 'max_ms', 'rows', 'errors'):
+        return jsonify({"error": "order must be one of total_seconds, calls, max_ms, rows, errors"}), 400
+    return jsonify(query_stats.snapshot(request.args.get('limit', 20, type=int), order)), 200
+
+@app.route('/api/v1.0/profiles', methods=['GET'])
+@profile_token_required
+def list_profiles():
+    return jsonify(request_profiler.list()), 200
+
+@app.route('/api/v1.0/profiles/<profile_id>', methods=['GET'])
+@profile_token_required
+def download_profile(profile_id):
+    """?kind=json (default, request details and top functions), prof (pstats dump) or tracemalloc (snapshot)"""
+    kind = request.args.get('kind', 'json')
+    path = request_profiler.path(profile_id, kind)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    if kind == 'json':
+        return send_file(path, mimetype='application/json')
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=os.path.basename(path))
+
+@app.route('/api/v1.0/pool-stats', methods=['GET'])
+@operator_required
+def pool_stats():
+    return jsonify(pool.stats()), 200
+
+@app.route('/api/v1.0/cache-stats', methods=['GET'])
+@operator_required
+def cache_stats():
+    return jsonify(response_cache.stats()), 200
+
+@app.route('/api/v1.0/outbox-stats', methods=['GET'])
+@operator_required
+def outbox_stats():
+    return jsonify(outbox_sender.stats()), 200
 
-@app.before_request
-def log_request_info():
-    print(f"Request Method: {request.method}")
-    print(f"Request URL: {request.url}")
-    print(f"Request Headers: {request.headers}")
-    print(f"Request Body: {request.get_data(as_text=True)}")
+@app.route('/api/v1.0/auth-stats', methods=['GET'])
+@operator_required
+def auth_stats():
+    return jsonify({
+        "hashing": password_hasher.stats(),
+        "user_throttle": user_attempts.stats(),
+        "ip_throttle": ip_attempts.stats(),
+    }), 200
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(expense_bp)
@@ -31,7 +261,8 @@ app.register_blueprint(expense_graph_bp)
 app.register_blueprint(ml_bp)
 app.register_blueprint(totals_bp)
 app.register_blueprint(budget_bp)
+app.register_blueprint(dashboard_bp)
 
 if __name__ == '__main__':
-    print("Starting Flask application...")
+    logger.info("Starting Flask application...")
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,66 @@
+import numpy as np
+
+# One record per tree node, every tree laid out back to back; child indexes
+# are absolute within the file and -1 marks a leaf.
+NODE_DTYPE = np.dtype([
+    ("left", "<i8"),
+    ("right", "<i8"),
+    ("feature", "<i8"),
+    ("threshold", "<f8"),
+    ("value", "<f8"),
+])
+
+
+class FlatForest:
+    """Read-only, array-backed copy of a fitted single-output tree ensemble.
+
+    scikit-learn copies tree arrays into private buffers when it unpickles
+    (even through joblib's mmap_mode), so every worker holds its own forest.
+    Exported to a plain ``.npy`` file, the nodes can be opened with
+    ``mmap_mode='r'`` and all workers share the same page-cache pages.
+    """
+
+    def __init__(self, nodes, roots):
+        self.nodes = nodes
+        self.roots = np.asarray(roots, dtype=np.int64)
+
+    @classmethod
+    def from_estimator(cls, model):
+        parts, roots, offset = [], [], 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            part = np.empty(tree.node_count, dtype=NODE_DTYPE)
+            leaf = tree.children_left == -1
+            part["left"] = np.where(leaf, -1, tree.children_left + offset)
+            part["right"] = np.where(leaf, -1, tree.children_right + offset)
+            part["feature"] = np.where(leaf, 0, tree.feature)
+            part["threshold"] = tree.threshold
+            part["value"] = tree.value[:, 0, 0]
+            parts.append(part)
+            roots.append(offset)
+            offset += tree.node_count
+        return cls(np.concatenate(parts), roots)
+
+    def save(self, path):
+        np.save(path, self.nodes, allow_pickle=False)
+
+    @property
+    def nbytes(self):
+        return self.nodes.nbytes
+
+    def predict(self, X):
+        """Mean leaf value over all trees, walking every (sample, tree) pair one level per step"""
+        # Trees compare float32 features against float64 thresholds, as scikit-learn does
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        left, right = self.nodes["left"], self.nodes["right"]
+        feature, threshold = self.nodes["feature"], self.nodes["threshold"]
+        while True:
+            next_left = left[node]
+            inner = next_left != -1
+            if not inner.any():
+                break
+            go_left = X[rows, feature[node]] <= threshold[node]
+            node = np.where(inner, np.where(go_left, next_left, right[node]), node)
+        return self.nodes["value"][node].mean(axis=1)
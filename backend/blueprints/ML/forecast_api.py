@@ -1,135 +1,228 @@
-from flask import Blueprint, jsonify
-from globals import cursor, conn
-from decorators import jwt_required
+from flask import Blueprint, request, jsonify
+from globals import get_conn, pool, storage
+from decorators import jwt_required, operator_required, etag_per_user, cached_per_user, uses_model, data_version
+from response_cache import response_cache
+from blueprints.ML.model_registry import ModelRegistry, ModelNotReady
+from blueprints.ML import training
+from blueprints.ML.training import FEATURES
+from blueprints.ML.timeseries import forecast_users, MAX_HORIZON
+import rollups
 import os
-import pickle
+from datetime import datetime
+from functools import lru_cache
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
 
 ml_bp = Blueprint('ml_bp', __name__)
 
-model_path = os.path.join(os.path.dirname(__file__), "next_month_net_predictor.pkl")
-
-def fetch_data():
-    query_income = """
-        SELECT 
-            name AS username, 
-            CONCAT(YEAR(date), '-', RIGHT('0' + CAST(MONTH(date) AS VARCHAR), 2)) AS month, 
-            SUM(amount) AS total_income
-        FROM salaries 
-        GROUP BY name, YEAR(date), MONTH(date)
-    """
-    query_expense = """
-        SELECT 
-            username, 
-            CONCAT(YEAR(date), '-', RIGHT('0' + CAST(MONTH(date) AS VARCHAR), 2)) AS month, 
-            SUM(amount) AS total_expense
-        FROM expenses 
-        GROUP BY username, YEAR(date), MONTH(date)
-    """
-    query_saving = """
-        SELECT 
-            category AS username, 
-            CONCAT(YEAR(date), '-', RIGHT('0' + CAST(MONTH(date) AS VARCHAR), 2)) AS month, 
-            SUM(amount) AS total_savings
-        FROM saving_goals 
-        GROUP BY category, YEAR(date), MONTH(date)
-    """
-
-    income_df = pd.read_sql(query_income, conn)
-    expense_df = pd.read_sql(query_expense, conn)
-    saving_df = pd.read_sql(query_saving, conn)
-
-    df = pd.merge(income_df, expense_df, on=["username", "month"], how="outer")
-    df = pd.merge(df, saving_df, on=["username", "month"], how="outer")
-    df.fillna(0, inplace=True)
-    df["net_earnings"] = df["total_income"] - df["total_expense"]
-    df.sort_values(by=["username", "month"], inplace=True)
-    df["next_month_net"] = df.groupby("username")["net_earnings"].shift(-1)
-    df.dropna(subset=["next_month_net"], inplace=True)
-
-    return df[["total_income", "total_expense", "total_savings", "next_month_net"]]
-
-def train_and_save_model():
-    df = fetch_data()
-    X = df[["total_income", "total_expense", "total_savings"]]
-    y = df["next_month_net"]
-
-    model = RandomForestRegressor()
-    model.fit(X, y)
-
-    with open(model_path, "wb") as f:
-        pickle.dump(model, f)
-
-    print(f"✅ Model trained and saved at {model_path}")
-
-if not os.path.exists(model_path):
-    train_and_save_model()
-
-with open(model_path, "rb") as f:
-    model = pickle.load(f)
+def train_model(current, incremental):
+    with pool.connection() as conn:
+        return training.train(conn, current, incremental)
+
+registry = ModelRegistry(
+    os.path.dirname(__file__),
+    "next_month_net_predictor",
+    train_model,
+    legacy_path=os.path.join(os.path.dirname(__file__), "next_month_net_predictor.pkl"),
+    on_swap=lambda metadata: forget_forecasts(metadata),
+)
+
+# Most recent month's total for every (user, kind)
+LATEST_TOTALS_SQL = """
+    SELECT r.username, r.kind, SUM(r.total)
+    FROM monthly_rollups r
+    JOIN (
+        SELECT username, kind, MAX(month) AS month
+        FROM monthly_rollups
+        {where}
+        GROUP BY username, kind
+    ) latest ON latest.username = r.username AND latest.kind = r.kind AND latest.month = r.month
+    GROUP BY r.username, r.kind
+"""
+
+# Keeps IN lists under SQL Server's 2100 parameter limit
+USERNAME_CHUNK = 1000
+
+def latest_features(cursor, usernames=None):
+    """Feature matrix indexed by username; listed users without data get zeros"""
+    chunks = [usernames[i:i + USERNAME_CHUNK] for i in range(0, len(usernames), USERNAME_CHUNK)] if usernames else [None]
+    rows = []
+    for chunk in chunks:
+        where = f"WHERE username IN ({', '.join('?' for _ in chunk)})" if chunk else ""
+        cursor.execute(LATEST_TOTALS_SQL.format(where=where), tuple(chunk or ()))
+        rows.extend((username, kind, float(total)) for username, kind, total in cursor.fetchall())
+
+    totals = pd.DataFrame(rows, columns=["username", "kind", "total"])
+    features = totals.pivot_table(index="username", columns="kind", values="total", aggfunc="sum", fill_value=0.0)
+    features = features.rename(columns={
+        rollups.INCOME: "total_income",
+        rollups.EXPENSE: "total_expense",
+        rollups.SAVING: "total_savings",
+    }).reindex(columns=FEATURES, fill_value=0.0)
+    if usernames:
+        features = features.reindex(usernames, fill_value=0.0)
+    return features.round(2)
+
+def predict_features(features):
+    """One vectorised predict over the whole matrix; returns (predictions, model metadata)"""
+    model, metadata = registry.get()
+    if features.empty:
+        return np.array([]), metadata
+    return np.round(model.predict(features[FEATURES].to_numpy()), 2), metadata
+
+def store_predictions(cursor, features, predictions, model_version, replace_all=False):
+    usernames = features.index.tolist()
+    if replace_all:
+        cursor.execute("DELETE FROM predictions")
+    else:
+        for i in range(0, len(usernames), USERNAME_CHUNK):
+            chunk = usernames[i:i + USERNAME_CHUNK]
+            cursor.execute(f"DELETE FROM predictions WHERE username IN ({', '.join('?' for _ in chunk)})", tuple(chunk))
+
+    predicted_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = [
+        (username, float(prediction), *map(float, totals), model_version, predicted_at)
+        for username, prediction, totals in zip(usernames, predictions, features[FEATURES].itertuples(index=False))
+    ]
+    storage.executemany(cursor, """
+        INSERT INTO predictions (username, prediction, total_income, total_expense, total_savings, model_version, predicted_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    return len(rows)
+
+def predict_all(conn, usernames=None):
+    """Forecast every user (or the listed ones) in one query and one predict call; returns rows stored"""
+    with storage.transaction(conn) as cursor:
+        features = latest_features(cursor, usernames)
+        predictions, metadata = predict_features(features)
+        return store_predictions(cursor, features, predictions, metadata["version"], replace_all=not usernames)
+
+def forecast_payload(prediction, total_income, total_expense, total_savings, model_version):
+    if prediction > 0:
+        msg = f"Next month: You will likely gain £{prediction}"
+    elif prediction < 0:
+        msg = f"Next month: You may lose £{abs(prediction)}"
+    else:
+        msg = "Next month: Your net earnings will be neutral"
+
+    return {
+        "message": msg,
+        "prediction": prediction,
+        "details": {
+            "income": total_income,
+            "expense": total_expense,
+            "savings": total_savings
+        },
+        "model_version": model_version
+    }
+
+@lru_cache(maxsize=4096)
+def predict_one(model, total_income, total_expense, total_savings):
+    """Memoised single-user inference; the model object is part of the key, so a swap can never serve old results"""
+    return round(float(model.predict(np.array([[total_income, total_expense, total_savings]]))[0]), 2)
+
+def forget_forecasts(metadata):
+    """Called when a new model is swapped in; retires the cached responses and ETags of uses_model views only"""
+    predict_one.cache_clear()
+    response_cache.model_version = metadata["version"]
+
+def cached_forecast(username, compute):
+    """The user's forecast payload, recomputed only after one of their writes or a model swap"""
+    key = (username, "forecast", response_cache.model_version)
+    version = data_version(username)
+    payload = response_cache.get(key, version)
+    if payload is None:
+        payload = compute()
+        response_cache.put(key, version, payload)
+    return payload
+
+def forecast_next_month(total_income, total_expense, total_savings):
+    """Prediction payload from the latest month's totals; raises ModelNotReady before the first model exists"""
+    model, metadata = registry.get()
+    prediction = predict_one(model, total_income, total_expense, total_savings)
+    return forecast_payload(prediction, total_income, total_expense, total_savings, metadata["version"])
+
+def stored_forecast(conn, username):
+    """The predictions row while it matches the current model, otherwise predict and store it"""
+    model, metadata = registry.get()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT prediction, total_income, total_expense, total_savings, model_version
+        FROM predictions WHERE username = ?
+    """, (username,))
+    row = cursor.fetchone()
+    if row is not None and row[4] == metadata["version"]:
+        return forecast_payload(*(float(v) for v in row[:4]), row[4])
+
+    try:
+        with storage.transaction(conn) as cursor:
+            features = latest_features(cursor, [username])
+            totals = features.loc[username, FEATURES].tolist()
+            prediction = predict_one(model, *totals)
+            store_predictions(cursor, features, [prediction], metadata["version"])
+    except storage.IntegrityError:
+        pass  # a concurrent request stored the same forecast first
+
+    return forecast_payload(prediction, *totals, metadata["version"])
 
 @ml_bp.route("/api/v1.0/predict-next-month", methods=["GET"])
 @jwt_required
+@etag_per_user
+@cached_per_user
+@uses_model
 def predict_next_month(username):
+    """GET: next month's net earnings forecast for the logged-in user"""
     try:
-        cursor.execute("""
-            SELECT TOP 1 
-                CONCAT(YEAR(date), '-', RIGHT('0' + CAST(MONTH(date) AS VARCHAR), 2)) AS month, 
-                SUM(amount)
-            FROM salaries 
-            WHERE name = ? 
-            GROUP BY YEAR(date), MONTH(date) 
-            ORDER BY month DESC
-        """, (username,))
-        income_row = cursor.fetchone()
-        total_income = float(income_row[1]) if income_row else 0.0
-
-        cursor.execute("""
-            SELECT TOP 1 
-                CONCAT(YEAR(date), '-', RIGHT('0' + CAST(MONTH(date) AS VARCHAR), 2)) AS month, 
-                SUM(amount)
-            FROM expenses 
-            WHERE username = ? 
-            GROUP BY YEAR(date), MONTH(date) 
-            ORDER BY month DESC
-        """, (username,))
-        expense_row = cursor.fetchone()
-        total_expense = float(expense_row[1]) if expense_row else 0.0
-
-        cursor.execute("""
-            SELECT TOP 1 
-                CONCAT(YEAR(date), '-', RIGHT('0' + CAST(MONTH(date) AS VARCHAR), 2)) AS month, 
-                SUM(amount)
-            FROM saving_goals 
-            WHERE category = ? 
-            GROUP BY YEAR(date), MONTH(date) 
-            ORDER BY month DESC
-        """, (username,))
-        savings_row = cursor.fetchone()
-        total_savings = float(savings_row[1]) if savings_row else 0.0
-
-        features = np.array([[total_income, total_expense, total_savings]])
-        prediction = round(model.predict(features)[0], 2)
-
-        if prediction > 0:
-            msg = f"Next month: You will likely gain £{prediction}"
-        elif prediction < 0:
-            msg = f"Next month: You may lose £{abs(prediction)}"
-        else:
-            msg = "Next month: Your net earnings will be neutral"
-
-        return jsonify({
-            "message": msg,
-            "prediction": prediction,
-            "details": {
-                "income": total_income,
-                "expense": total_expense,
-                "savings": total_savings
-            }
-        }), 200
+        return jsonify(cached_forecast(username, lambda: stored_forecast(get_conn(), username))), 200
+    except ModelNotReady as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    
-    
\ No newline at end of file
+
+def fetch_series_rows(cursor, usernames=None):
+    """(username, kind, category, month, total) income and expense rows for forecast_users"""
+    chunks = [usernames[i:i + USERNAME_CHUNK] for i in range(0, len(usernames), USERNAME_CHUNK)] if usernames else [None]
+    rows = []
+    for chunk in chunks:
+        where = f"AND username IN ({', '.join('?' for _ in chunk)})" if chunk else ""
+        cursor.execute(f"""
+            SELECT username, kind, category, month, total
+            FROM monthly_rollups
+            WHERE kind IN (?, ?) {where}
+        """, (rollups.INCOME, rollups.EXPENSE) + tuple(chunk or ()))
+        rows.extend(cursor.fetchall())
+    return rows
+
+def horizon_arg(default=3):
+    try:
+        horizon = int(request.args.get("horizon", default))
+    except ValueError:
+        horizon = default
+    return max(1, min(horizon, MAX_HORIZON))
+
+@ml_bp.route("/api/v1.0/forecast", methods=["GET"])
+@jwt_required
+@etag_per_user
+@cached_per_user
+def forecast_categories(username):
+    """GET: income and per-category spending projected for the next ?horizon= months (1-12, default 3)"""
+    try:
+        horizon = horizon_arg()
+        forecast = forecast_users(fetch_series_rows(get_conn().cursor(), [username]), horizon)
+        if username not in forecast:
+            return jsonify({"error": "No income or expenses to forecast from"}), 404
+        return jsonify(dict(forecast[username], horizon=horizon)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@ml_bp.route("/api/v1.0/model", methods=["GET"])
+@operator_required
+def model_status():
+    return jsonify(dict(registry.status(), prediction_memo=predict_one.cache_info()._asdict())), 200
+
+@ml_bp.route("/api/v1.0/model/retrain", methods=["POST"])
+@operator_required
+def retrain_model():
+    """Train a new model in the background (?mode=incremental to only add the new months); predictions keep using the current one until it is swapped in"""
+    started = registry.train_async(incremental=request.args.get("mode") == "incremental")
+    return jsonify({"message": "Training started" if started else "Training already in progress"}), 202
@@ -0,0 +1,320 @@
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from blueprints.ML.flat_forest import FlatForest
+
+# After a failed background run, get() waits this long before starting another one
+TRAIN_RETRY_SECONDS = float(os.environ.get('TRAIN_RETRY_SECONDS', 300))
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotReady(Exception):
+    pass
+
+
+def resident_bytes():
+    """Current resident set size of this process (Linux), or None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class PeakResident:
+    """Highest resident set size sampled while the block runs (Linux); ``peak`` stays None elsewhere"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = resident_bytes()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._sample()
+        return False
+
+
+def tree_roots(nodes):
+    """Index of each tree's root in a FlatForest node file: the nodes nobody points to"""
+    children = np.concatenate([nodes["left"], nodes["right"]])
+    return np.setdiff1d(np.arange(len(nodes)), children[children >= 0])
+
+
+class ModelRegistry:
+    """Lazily loaded, hot-swappable forecast model.
+
+    Trained models are written as ``<name>-<version>.pkl`` (the estimator,
+    kept for incremental training) and ``<name>-<version>.forest.npy`` (a
+    FlatForest export that is what gets served), next to a ``<name>.json``
+    pointer holding the current version's metadata. The pointer is replaced
+    atomically after both files are fully written, so readers in any worker
+    process either see the old model or the new one. The forest file is
+    memory-mapped read-only, so every worker on a box shares one copy.
+    ``get`` re-reads the pointer at most every ``reload_interval`` seconds,
+    which is how workers pick up a model trained elsewhere.
+
+    ``trainer(current, incremental)`` gets the serving (model, metadata) or
+    None and returns a new (model, metadata). Every run, successful or not,
+    is appended to ``<name>-runs.jsonl`` with its duration and the highest
+    process RSS sampled while the trainer ran.
+    """
+
+    def __init__(self, model_dir, name, trainer, legacy_path=None, reload_interval=10, keep=3, on_swap=None,
+                 retry_interval=TRAIN_RETRY_SECONDS):
+        self.model_dir = model_dir
+        self.name = name
+        self.trainer = trainer
+        self.legacy_path = legacy_path
+        self.reload_interval = reload_interval
+        self.keep = keep
+        self.on_swap = on_swap
+        self.retry_interval = retry_interval
+        self.pointer_path = os.path.join(model_dir, f"{name}.json")
+        self.runs_path = os.path.join(model_dir, f"{name}-runs.jsonl")
+        self._lock = threading.Lock()
+        self._current = None
+        self._pointer_mtime = None
+        self._checked_at = 0.0
+        self._training = None
+        self._last_error = None
+        self._failed_at = None
+        self._load_report = None
+
+    def get(self):
+        """(model, metadata) currently serving; starts a background training run if there is none.
+
+        A failed run is not retried from here for ``retry_interval`` seconds;
+        until then callers get ModelNotReady carrying its error.
+        """
+        now = time.monotonic()
+        if self._current is None or now - self._checked_at >= self.reload_interval:
+            with self._lock:
+                if self._current is None or now - self._checked_at >= self.reload_interval:
+                    self._checked_at = now
+                    self._reload_if_changed()
+        current = self._current
+        if current is None:
+            failed_at = self._failed_at
+            if failed_at is not None and now - failed_at < self.retry_interval:
+                raise ModelNotReady(f"Forecast model is unavailable: {self._last_error}")
+            self.train_async()
+            raise ModelNotReady("Forecast model is being trained, try again shortly")
+        return current
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.pointer_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime is not None and mtime != self._pointer_mtime:
+            with open(self.pointer_path) as f:
+                metadata = json.load(f)
+            if self._current is None or self._current[1].get("version") != metadata["version"]:
+                self._swap(*self._load(metadata))
+            self._pointer_mtime = mtime
+        elif self._current is None and self.legacy_path and os.path.exists(self.legacy_path):
+            # Bare pickle from before models carried metadata; exported once so it can be mapped too
+            metadata = {"version": "legacy", "file": os.path.basename(self.legacy_path)}
+            serving_file = f"{self.name}.forest.npy"
+            serving_path = os.path.join(self.model_dir, serving_file)
+            if not os.path.exists(serving_path):
+                try:
+                    with open(self.legacy_path, "rb") as f:
+                        FlatForest.from_estimator(pickle.load(f)).save(serving_path + f".{os.getpid()}.tmp.npy")
+                    os.replace(serving_path + f".{os.getpid()}.tmp.npy", serving_path)
+                except (OSError, AttributeError) as e:
+                    logger.warning("Could not export %s for memory mapping: %s", metadata['file'], e)
+            if os.path.exists(serving_path):
+                metadata["serving_file"] = serving_file
+            self._swap(*self._load(metadata))
+
+    def _load(self, metadata):
+        """(model, metadata) for a saved version, recording how long it took and what it cost"""
+        started = time.perf_counter()
+        rss_before = resident_bytes()
+        serving_file = metadata.get("serving_file")
+        if serving_file and os.path.exists(os.path.join(self.model_dir, serving_file)):
+            path = os.path.join(self.model_dir, serving_file)
+            nodes = np.load(path, mmap_mode="r", allow_pickle=False)
+            model = FlatForest(nodes, tree_roots(nodes))
+            model_bytes = model.nbytes
+            mapped = True
+        else:
+            path = os.path.join(self.model_dir, metadata["file"])
+            with open(path, "rb") as f:
+                model = pickle.load(f)
+            model_bytes = os.path.getsize(path)
+            mapped = False
+        rss_after = resident_bytes()
+
+        self._load_report = {
+            "version": metadata["version"],
+            "file": os.path.basename(path),
+            "memory_mapped": mapped,
+            "load_seconds": round(time.perf_counter() - started, 4),
+            "model_bytes": model_bytes,
+            "process_rss_bytes": rss_after,
+            "rss_delta_bytes": rss_after - rss_before if rss_after is not None and rss_before is not None else None,
+        }
+        logger.info(
+            "Loaded model %s from %s in %ss (%s%.1f MiB model, RSS %.1f MiB)",
+            metadata['version'], self._load_report['file'], self._load_report['load_seconds'],
+            'mmap, ' if mapped else '', model_bytes / 2**20, (rss_after or 0) / 2**20
+        )
+        return model, metadata
+
+    def estimator(self, metadata):
+        """The trainable estimator behind a version (the served FlatForest cannot be refitted)"""
+        with open(os.path.join(self.model_dir, metadata["file"]), "rb") as f:
+            return pickle.load(f)
+
+    def _swap(self, model, metadata):
+        self._current = (model, metadata)
+        if self.on_swap:
+            self.on_swap(metadata)
+
+    def train(self, incremental=False):
+        """Train, persist and swap in a new version; returns its metadata"""
+        with self._lock:
+            self._reload_if_changed()
+            current = self._current
+        if incremental and current is not None and isinstance(current[0], FlatForest):
+            current = (self.estimator(current[1]), current[1])
+
+        started = time.perf_counter()
+        run = {"started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z", "incremental": incremental}
+        sampler = PeakResident()
+        try:
+            with sampler:
+                model, metadata = self.trainer(current, incremental)
+        except Exception as e:
+            run.update(status="failed", error=str(e))
+            raise
+        else:
+            run.update(status="ok")
+        finally:
+            run.update(
+                training_seconds=round(time.perf_counter() - started, 3),
+                peak_memory_bytes=sampler.peak,
+            )
+            if run["status"] == "failed":
+                self._log_run(run)
+
+        version = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+        metadata = dict(
+            metadata,
+            version=version,
+            file=f"{self.name}-{version}.pkl",
+            serving_file=f"{self.name}-{version}.forest.npy" if hasattr(model, "estimators_") else None,
+            trained_at=datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            training_seconds=run["training_seconds"],
+            peak_memory_bytes=run["peak_memory_bytes"],
+        )
+
+        model_path = os.path.join(self.model_dir, metadata["file"])
+        with open(model_path + ".tmp", "wb") as f:
+            pickle.dump(model, f)
+        os.replace(model_path + ".tmp", model_path)
+        if metadata["serving_file"]:
+            serving_path = os.path.join(self.model_dir, metadata["serving_file"])
+            # np.save appends .npy to names that lack it
+            FlatForest.from_estimator(model).save(serving_path + ".tmp.npy")
+            os.replace(serving_path + ".tmp.npy", serving_path)
+        with open(self.pointer_path + ".tmp", "w") as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(self.pointer_path + ".tmp", self.pointer_path)
+
+        # Serve the mapped export like every other worker will, not the in-memory estimator
+        served = self._load(metadata)
+        with self._lock:
+            self._swap(*served)
+            self._pointer_mtime = os.stat(self.pointer_path).st_mtime_ns
+        self._prune(version)
+        self._log_run(dict(run, version=version, mode=metadata.get("mode"), training_rows=metadata.get("training_rows")))
+        logger.info("Model %s trained on %s rows and saved at %s", version, metadata.get('training_rows'), model_path)
+        return metadata
+
+    def _log_run(self, run):
+        try:
+            with open(self.runs_path, "a") as f:
+                f.write(json.dumps(run) + "\n")
+        except OSError as e:
+            logger.warning("Could not record training run: %s", e)
+
+    def runs(self, limit=20):
+        try:
+            with open(self.runs_path) as f:
+                lines = f.readlines()[-limit:]
+        except FileNotFoundError:
+            return []
+        return [json.loads(line) for line in lines]
+
+    def _prune(self, current_version):
+        prefix = f"{self.name}-"
+        files = [f for f in os.listdir(self.model_dir) if f.startswith(prefix) and f.endswith((".pkl", ".forest.npy"))]
+        versions = sorted({f[len(prefix):].split(".")[0] for f in files} - {current_version})
+        stale = set(versions[:-self.keep or None])
+        for old in files:
+            if old[len(prefix):].split(".")[0] in stale:
+                try:
+                    os.remove(os.path.join(self.model_dir, old))
+                except OSError:
+                    pass
+
+    def train_async(self, incremental=False):
+        """Start a background training run unless one is already going; True if started"""
+        with self._lock:
+            if self._training is not None and self._training.is_alive():
+                return False
+
+            def run():
+                try:
+                    self.train(incremental)
+                    self._last_error = None
+                    self._failed_at = None
+                except Exception as e:
+                    self._last_error = str(e)
+                    self._failed_at = time.monotonic()
+                    logger.exception("Model training failed: %s", e)
+
+            self._training = threading.Thread(target=run, name=f"{self.name}-training", daemon=True)
+            self._training.start()
+            return True
+
+    def status(self):
+        current = self._current
+        return {
+            "loaded": current is not None,
+            "metadata": current[1] if current else None,
+            "training": self._training is not None and self._training.is_alive(),
+            "last_error": self._last_error,
+            "load": self._load_report,
+            "recent_runs": self.runs(5),
+        }
@@ -0,0 +1,120 @@
+import numpy as np
+import rollups
+
+# Damped-trend (Holt) smoothing parameters
+ALPHA = 0.5
+BETA = 0.2
+PHI = 0.9
+# Seasonal month-of-year offsets need at least two of each calendar month
+SEASONAL_MIN_MONTHS = 24
+MAX_HORIZON = 12
+
+
+def month_index(month):
+    year, mon = month.split("-")
+    return int(year) * 12 + int(mon) - 1
+
+
+def month_label(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def forecast_series(Y, start, end, month_of_year, horizon):
+    """Forecast ``horizon`` steps past ``end`` for every row of ``Y`` at once.
+
+    ``Y`` is (series, months) on a shared month axis; each series is only
+    read between its own ``start`` and ``end`` column. Series with at least
+    SEASONAL_MIN_MONTHS of history are deseasonalised with month-of-year
+    averages before damped-trend exponential smoothing, and the offsets are
+    added back to the projection. Negative projections are clipped to 0.
+    """
+    n_series, n_months = Y.shape
+    columns = np.arange(n_months)
+    active = (columns >= start[:, None]) & (columns <= end[:, None])
+    span = active.sum(axis=1)
+
+    offsets = np.zeros((n_series, 12))
+    seasonal = span >= SEASONAL_MIN_MONTHS
+    if seasonal.any():
+        weights = active[:, :, None] * np.eye(12)[month_of_year][None]
+        counts = weights.sum(axis=1)
+        sums = (Y[:, :, None] * weights).sum(axis=1)
+        mean = (Y * active).sum(axis=1) / np.maximum(span, 1)
+        offsets = np.where(counts > 0, sums / np.maximum(counts, 1) - mean[:, None], 0.0)
+        offsets[~seasonal] = 0.0
+    D = Y - offsets[:, month_of_year]
+
+    rows = np.arange(n_series)
+    level = D[rows, start]
+    trend = np.zeros(n_series)
+    for column in range(n_months):
+        update = active[:, column] & (column > start)
+        if not update.any():
+            continue
+        new_level = ALPHA * D[:, column] + (1 - ALPHA) * (level + PHI * trend)
+        new_trend = BETA * (new_level - level) + (1 - BETA) * PHI * trend
+        level = np.where(update, new_level, level)
+        trend = np.where(update, new_trend, trend)
+
+    steps = np.arange(1, horizon + 1)
+    damping = np.cumsum(PHI ** steps)
+    target_month = (month_of_year[end][:, None] + steps) % 12
+    projection = level[:, None] + damping[None] * trend[:, None] + np.take_along_axis(offsets, target_month, axis=1)
+    return np.maximum(projection, 0.0).round(2)
+
+
+def forecast_users(rows, horizon):
+    """Per-user income and per-category expense projections from monthly_rollups rows.
+
+    ``rows`` are (username, kind, category, month, total). Every series of
+    every user goes through one forecast_series call; each user's history
+    runs from their first to their last recorded month, with missing
+    months counted as 0.
+    """
+    series = {}
+    user_span = {}
+    for username, kind, category, month, total in rows:
+        if kind == rollups.INCOME:
+            key = (username, rollups.INCOME, "")
+        elif kind == rollups.EXPENSE:
+            key = (username, rollups.EXPENSE, category or "")
+        else:
+            continue
+        index = month_index(month)
+        values = series.setdefault(key, {})
+        values[index] = values.get(index, 0.0) + float(total)
+        first, last = user_span.get(username, (index, index))
+        user_span[username] = (min(first, index), max(last, index))
+    if not series:
+        return {}
+
+    first_month = min(first for first, _ in user_span.values())
+    last_month = max(last for _, last in user_span.values())
+    keys = list(series)
+    Y = np.zeros((len(keys), last_month - first_month + 1))
+    for i, key in enumerate(keys):
+        for index, total in series[key].items():
+            Y[i, index - first_month] = total
+    start = np.array([user_span[key[0]][0] - first_month for key in keys])
+    end = np.array([user_span[key[0]][1] - first_month for key in keys])
+    month_of_year = (np.arange(first_month, last_month + 1)) % 12
+
+    projections = forecast_series(Y, start, end, month_of_year, horizon)
+
+    result = {}
+    for (username, kind, category), projection in zip(keys, projections.tolist()):
+        first, last = user_span[username]
+        forecast = result.setdefault(username, {
+            "months": [month_label(last + step) for step in range(1, horizon + 1)],
+            "history_months": last - first + 1,
+            "income": [0.0] * horizon,
+            "expenses": {},
+            "total_expenses": [0.0] * horizon,
+        })
+        if kind == rollups.INCOME:
+            forecast["income"] = projection
+        elif category:
+            forecast["expenses"][category] = projection
+        if kind == rollups.EXPENSE:
+            forecast["total_expenses"] = [round(a + b, 2) for a, b in zip(forecast["total_expenses"], projection)]
+    return result
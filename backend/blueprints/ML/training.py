@@ -0,0 +1,149 @@
+import copy
+import math
+import os
+from datetime import datetime
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+import rollups
+
+FEATURES = ["total_income", "total_expense", "total_savings"]
+TARGET = "next_month_net"
+KIND_COLUMNS = {rollups.INCOME: 0, rollups.EXPENSE: 1, rollups.SAVING: 2}
+
+TRAIN_CHUNK_ROWS = int(os.environ.get('TRAIN_CHUNK_ROWS', 50000))
+TREES_PER_CHUNK = int(os.environ.get('TREES_PER_CHUNK', 100))
+MAX_TREES = int(os.environ.get('MAX_TREES', 300))
+FETCH_ROWS = 5000
+
+
+def current_month():
+    return datetime.now().strftime("%Y-%m")
+
+
+def iter_user_months(cursor, since=None, until=None):
+    """(username, month, [income, expense, savings]) in username/month order, streamed from monthly_rollups.
+
+    Months are 'YYYY-MM'; ``since`` is inclusive and ``until`` exclusive.
+    """
+    conditions, params = [], []
+    if since:
+        conditions.append("month >= ?")
+        params.append(since)
+    if until:
+        conditions.append("month < ?")
+        params.append(until)
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    cursor.execute(f"""
+        SELECT username, month, kind, SUM(total)
+        FROM monthly_rollups
+        {where}
+        GROUP BY username, month, kind
+        ORDER BY username, month
+    """, tuple(params))
+
+    current_key, totals = None, None
+    while True:
+        rows = cursor.fetchmany(FETCH_ROWS)
+        if not rows:
+            break
+        for username, month, kind, total in rows:
+            if (username, month) != current_key:
+                if current_key is not None:
+                    yield (*current_key, totals)
+                current_key, totals = (username, month), [0.0, 0.0, 0.0]
+            totals[KIND_COLUMNS[kind]] += float(total)
+    if current_key is not None:
+        yield (*current_key, totals)
+
+
+def iter_training_chunks(cursor, since=None, until=None, chunk_rows=TRAIN_CHUNK_ROWS):
+    """(X, y, last_month) arrays of at most ``chunk_rows`` training rows.
+
+    Each row is one user-month's totals; the target is the net earnings of
+    that user's next recorded month. With ``since``, only pairs whose target
+    month is after ``since`` are produced; with ``until``, months from
+    ``until`` on (still being recorded) are left out entirely.
+    """
+    X = np.empty((chunk_rows, len(FEATURES)))
+    y = np.empty(chunk_rows)
+    filled = 0
+    last_month = None
+    previous = None
+    for username, month, totals in iter_user_months(cursor, since, until):
+        if previous is not None and previous[0] == username and (since is None or month > since):
+            X[filled] = previous[2]
+            y[filled] = totals[0] - totals[1]
+            filled += 1
+            last_month = max(last_month or month, month)
+            if filled == chunk_rows:
+                yield X[:filled].copy(), y[:filled].copy(), last_month
+                filled = 0
+        previous = (username, month, totals)
+    if filled:
+        yield X[:filled].copy(), y[:filled].copy(), last_month
+
+
+def add_trees(model, X, y, trees):
+    """Grow ``model`` by ``trees`` trees fitted on (X, y), dropping the oldest beyond MAX_TREES"""
+    if model is None:
+        model = RandomForestRegressor(n_estimators=trees, warm_start=True)
+    else:
+        model.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees)
+    model.fit(X, y)
+    if len(model.estimators_) > MAX_TREES:
+        model.estimators_ = model.estimators_[-MAX_TREES:]
+        model.set_params(n_estimators=MAX_TREES)
+    return model
+
+
+def train(conn, current=None, incremental=False):
+    """Train the forecast model chunk by chunk; returns (model, metadata).
+
+    A full run grows a fresh forest by TREES_PER_CHUNK trees per chunk, so
+    only one chunk of training rows is in memory at a time. An incremental
+    run adds trees fitted only on the month pairs that completed after the
+    current model's ``trained_through`` month, in proportion to how much
+    new data there is. The current calendar month is never trained on, so
+    ``trained_through`` is always a completed month.
+    """
+    since = None
+    model = None
+    trained_rows = 0
+    if incremental and current is not None and current[1].get("trained_through"):
+        model, previous = copy.deepcopy(current[0]), current[1]
+        since = previous["trained_through"]
+        trained_rows = previous.get("training_rows", 0)
+
+    until = current_month()
+    cursor = conn.cursor()
+    new_rows = 0
+    chunks = 0
+    trained_through = since
+    for X, y, last_month in iter_training_chunks(cursor, since, until):
+        if since is not None:
+            trees = max(1, round(len(model.estimators_) * len(y) / max(trained_rows + new_rows, 1)))
+        elif chunks == 0:
+            trees = TREES_PER_CHUNK
+        else:
+            trees = max(1, math.ceil(TREES_PER_CHUNK * len(y) / TRAIN_CHUNK_ROWS))
+        model = add_trees(model, X, y, trees)
+        new_rows += len(y)
+        chunks += 1
+        trained_through = max(trained_through or last_month, last_month)
+
+    if model is None:
+        raise ValueError(f"No consecutive completed months of data before {until} to train on")
+    if since is not None and new_rows == 0:
+        raise ValueError(f"No months completed after {since} to train on")
+
+    return model, {
+        "mode": "incremental" if since is not None else "full",
+        "training_rows": trained_rows + new_rows,
+        "new_rows": new_rows,
+        "chunks": chunks,
+        "trained_through": trained_through,
+        "n_estimators": len(model.estimators_),
+        "features": FEATURES,
+        "target": TARGET,
+        "estimator": type(model).__name__,
+    }
@@ -1,61 +1,151 @@
+import logging
 import uuid
 from flask import Blueprint, request, jsonify, make_response, url_for
 import globals
-from decorators import jwt_required, log_request
+import jwt
+from decorators import jwt_required, log_request, decode_token, is_revoked
+from token_cache import revoked_tokens, verified_tokens, token_id
 from datetime import datetime, timedelta
-import bcrypt
+from passwords import password_hasher, user_attempts, ip_attempts, HashingBusy
 from jwt import encode, decode  
-from globals import cursor, conn  
+from globals import get_conn
 from flask import current_app as app  
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import outbox
+from outbox import outbox_sender
 import secrets
 from dateutil.parser import parse  
 
+logger = logging.getLogger(__name__)
+
 auth_bp = Blueprint('auth_bp', __name__)
 
-def generate_token_response(username):
-    token = encode({
+def issue_token(username, token_type, lifetime):
+    return encode({
         'user': username,
-        'exp': datetime.utcnow() + timedelta(hours=100)  
-    }, str(app.config['SECRET_KEY']), algorithm='HS256')  
-    return make_response(jsonify({'token': token}), 200)
+        'typ': token_type,
+        'jti': uuid.uuid4().hex,
+        'exp': datetime.utcnow() + lifetime
+    }, str(app.config['SECRET_KEY']), algorithm='HS256')
+
+def generate_token_response(username):
+    body = {'token': issue_token(username, 'access', timedelta(minutes=app.config['ACCESS_TOKEN_MINUTES']))}
+    if app.config['REFRESH_TOKEN_DAYS']:
+        body['refresh_token'] = issue_token(username, 'refresh', timedelta(days=app.config['REFRESH_TOKEN_DAYS']))
+    return make_response(jsonify(body), 200)
+
+def revoke_token(cursor, claims, token):
+    """Record the token as revoked; False if it already was (the revoked_tokens insert is the single point of truth)"""
+    jti = token_id(claims, token)
+    try:
+        cursor.execute(
+            "INSERT INTO revoked_tokens (jti, expires_at) VALUES (?, ?)",
+            (jti, datetime.utcfromtimestamp(claims['exp']))
+        )
+        inserted = cursor.rowcount != 0
+    except globals.storage.IntegrityError:
+        inserted = False
+    revoked_tokens.add(jti, claims['exp'])
+    verified_tokens.discard(token)
+    return inserted
+
+def throttled_response(message, retry_after, code):
+    response = make_response(jsonify({'error': message}), code)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
 
 @auth_bp.route('/api/v1.0/login', methods=['POST'])
 def login():
+    conn = get_conn()
+    cursor = conn.cursor()
     auth = request.authorization
     if auth:
-        print(f"Attempting to log in user: {auth.username}")  
+        # Checked before any hashing so a throttled client costs no bcrypt time
+        retry_after = max(user_attempts.retry_after(auth.username), ip_attempts.retry_after(request.remote_addr))
+        if retry_after:
+            return throttled_response('Too many failed login attempts', retry_after, 429)
+
         cursor.execute("SELECT username, password FROM logins WHERE username = ?", (auth.username,))
         user = cursor.fetchone()
-        print(f"Query result: {user}") 
         if user:
-            print(f"User found: {user[0]}")  
-            if bcrypt.checkpw(auth.password.encode('utf-8'), user[1].encode('utf-8')):  
+            try:
+                matches, needs_rehash = password_hasher.verify(auth.password, user[1])
+            except HashingBusy as e:
+                return throttled_response(str(e), 1, 503)
+            if matches:
+                user_attempts.reset(auth.username)
+                if needs_rehash:
+                    rehash_password(conn, user[0], auth.password, user[1])
                 return generate_token_response(auth.username)  
             else:
+                user_attempts.failure(auth.username)
+                ip_attempts.failure(request.remote_addr)
                 return make_response(jsonify({'error': 'Invalid password'}), 401)
         else:
-            print("User not found")  
+            logger.info("Login for unknown user %s from %s", auth.username, request.remote_addr)
+            ip_attempts.failure(request.remote_addr)
             return make_response(jsonify({'error': 'User not found'}), 404)
     return make_response(jsonify({'error': 'Unauthorized access'}), 403)
 
+def rehash_password(conn, username, password, old_hash):
+    """Re-store a verified password at the configured bcrypt cost; skipped when hashing is saturated"""
+    try:
+        new_hash = password_hasher.hash(password)
+    except HashingBusy:
+        return
+    cursor = conn.cursor()
+    # Guarded so a password change that raced this login is not overwritten
+    cursor.execute(
+        "UPDATE logins SET password = ? WHERE username = ? AND password = ?",
+        (new_hash, username, old_hash)
+    )
+    conn.commit()
+
 @auth_bp.route('/api/v1.0/logout', methods=['POST'])
 @jwt_required
 def logout(username): 
+    conn = get_conn()
+    cursor = conn.cursor()
     token = request.headers['x-access-token']
-    cursor.execute("INSERT INTO blacklist (token) VALUES (?)", (token,))
+    revoke_token(cursor, decode_token(token), token)
+
+    refresh_token = request.headers.get('x-refresh-token')
+    if refresh_token:
+        try:
+            revoke_token(cursor, decode_token(refresh_token, 'refresh'), refresh_token)
+        except jwt.InvalidTokenError:
+            pass
     conn.commit()
     return make_response(jsonify({'message': f'Successfully logged out user {username}'}), 200)
 
+@auth_bp.route('/api/v1.0/refresh', methods=['POST'])
+def refresh():
+    token = request.headers.get('x-refresh-token')
+    if not token:
+        return make_response(jsonify({'error': 'Refresh token is missing'}), 401)
+
+    try:
+        claims = decode_token(token, 'refresh')
+    except jwt.InvalidTokenError:
+        return make_response(jsonify({'error': 'Refresh token is invalid'}), 401)
+
+    if is_revoked(claims, token):
+        return make_response(jsonify({'error': 'Refresh token is revoked'}), 401)
+
+    # Rotate: each refresh token can be exchanged exactly once. Concurrent refreshes can
+    # both pass is_revoked above; only the one whose insert lands gets new tokens.
+    conn = get_conn()
+    rotated = revoke_token(conn.cursor(), claims, token)
+    conn.commit()
+    if not rotated:
+        return make_response(jsonify({'error': 'Refresh token is revoked'}), 401)
+    return generate_token_response(claims['user'])
+
 @auth_bp.route('/api/v1.0/register', methods=['POST'])
 @log_request
 def register():
+    conn = get_conn()
+    cursor = conn.cursor()
     try:
-        print("Request Headers:", request.headers)
-        print("Request Form Data:", request.form)
-
         name = request.form.get('name')
         email = request.form.get('email')
         username = request.form.get('username')
@@ -72,7 +162,7 @@ def register():
         if cursor.fetchone()[0] > 0:
             return make_response(jsonify({'error': 'Username already taken'}), 409)
 
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')  
+        hashed_password = password_hasher.hash(password)
 
         user_id = str(uuid.uuid4())[:20]  
 
@@ -84,12 +174,16 @@ def register():
 
         return make_response(jsonify({'message': 'User registered successfully'}), 201)
 
+    except HashingBusy as e:
+        return throttled_response(str(e), 1, 503)
     except Exception as e:
-        print(f"Error during registration: {e}")
+        logger.exception("Error during registration: %s", e)
         return make_response(jsonify({'error': 'Internal server error'}), 500)
 
 @auth_bp.route('/api/v1.0/forgot-password', methods=['POST'])
 def forgot_password():
+    conn = get_conn()
+    cursor = conn.cursor()
     try:
         data = request.get_json()
         email = data.get('email')
@@ -106,30 +200,16 @@ def forgot_password():
         token = secrets.token_urlsafe(32)
         expires_at = datetime.utcnow() + timedelta(hours=1)
 
-        cursor.execute(
-            "INSERT INTO password_resets (email, token, expires_at, created_at) VALUES (?, ?, ?, ?)",
-            (email, token, expires_at, datetime.utcnow())
-        )
-        conn.commit()
-
-      
         reset_link = f"exp://192.168.1.214:8081/--/reset-password?token={token}"
 
-        sender_email = "choudhrymuhammad73@gmail.com"
-        sender_password = "nzbc coyt kurj cblh"
-        subject = "Password Reset Request"
-
-        message = MIMEMultipart()
-        message['From'] = sender_email
-        message['To'] = email
-        message['Subject'] = subject
-        body = f"Click the link to reset your password: {reset_link}"
-        message.attach(MIMEText(body, 'plain'))
-
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.sendmail(sender_email, email, message.as_string())
+        # Queued with the reset row and sent by the outbox thread, so the request never waits on SMTP
+        with globals.storage.transaction(conn) as cursor:
+            cursor.execute(
+                "INSERT INTO password_resets (email, token, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (email, token, expires_at, datetime.utcnow())
+            )
+            outbox.enqueue(cursor, email, "Password Reset Request", f"Click the link to reset your password: {reset_link}")
+        outbox_sender.notify()
 
         return make_response(jsonify({
             'message': 'Password reset link sent to your email',
@@ -137,11 +217,13 @@ def forgot_password():
         }), 200)
 
     except Exception as e:
-        print(f"Error in forgot password: {e}")
+        logger.exception("Error in forgot password: %s", e)
         return make_response(jsonify({'error': 'Internal server error'}), 500)
 
 @auth_bp.route('/api/v1.0/reset-password', methods=['POST'])
 def reset_password():
+    conn = get_conn()
+    cursor = conn.cursor()
     try:
         data = request.get_json()
         token = data.get('token')
@@ -164,24 +246,28 @@ def reset_password():
         if datetime.utcnow() > expires_at:  
             return make_response(jsonify({'error': 'Token has expired'}), 400)
 
-        hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = password_hasher.hash(new_password)
 
         cursor.execute("UPDATE logins SET password = ? WHERE email = ?", (hashed_password, email))
         conn.commit()
 
-        print(f"Password updated successfully for email: {email}")
+        logger.info("Password reset completed for %s", email)
 
         cursor.execute("DELETE FROM password_resets WHERE token = ?", (token,))
         conn.commit()
 
         return make_response(jsonify({'message': 'Password reset successfully'}), 200)
 
+    except HashingBusy as e:
+        return throttled_response(str(e), 1, 503)
     except Exception as e:
-        print(f"Error in reset password: {e}")
+        logger.exception("Error in reset password: %s", e)
         return make_response(jsonify({'error': 'Internal server error'}), 500)
 
 @auth_bp.route('/api/v1.0/google-login', methods=['POST'])
 def google_login():
+    conn = get_conn()
+    cursor = conn.cursor()
     try:
         data = request.get_json()
         email = data.get('email')
@@ -207,5 +293,5 @@ def google_login():
         return generate_token_response(username)
 
     except Exception as e:
-        print(f"Google login error: {e}")
+        logger.exception("Google login error: %s", e)
         return make_response(jsonify({'error': 'Internal server error'}), 500)
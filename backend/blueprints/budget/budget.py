@@ -1,42 +1,84 @@
 import uuid
 from flask import Blueprint, request, jsonify, make_response
 from datetime import datetime
-from globals import cursor, conn
-from decorators import login_required
+import pandas as pd
+from globals import get_conn, storage
+import rollups
+from decorators import login_required, etag_per_user
 
 budget_bp = Blueprint('budget_bp', __name__)
 
 allowed_categories = ['Entertainment', 'Groceries', 'Transport', 'Dining']
 
+def adjust_used_amount(cursor, username, category, date, delta):
+    """In-database increment of used_amount for budgets created by the expense's date; run it in the expense's transaction"""
+    if delta:
+        cursor.execute(
+            "UPDATE budgets SET used_amount = used_amount + ? WHERE username = ? AND category = ? AND created_at <= ?",
+            (delta, username, category, date)
+        )
+
+def adjust_used_amounts(cursor, username, df):
+    """Bulk counterpart of adjust_used_amount for a DataFrame of new expenses: one UPDATE per affected budget"""
+    cursor.execute("SELECT id, category, created_at FROM budgets WHERE username = ?", (username,))
+    budgets = cursor.fetchall()
+    if not budgets:
+        return
+    dates = pd.to_datetime(df["date"])
+    for budget_id, category, created_at in budgets:
+        delta = float(df["amount"][(df["category"] == category) & (dates >= pd.Timestamp(created_at))].sum())
+        if delta:
+            cursor.execute("UPDATE budgets SET used_amount = used_amount + ? WHERE id = ?", (delta, budget_id))
+
+def reconcile_budgets(conn):
+    """Rebuild used_amount for every budget from the expenses dated since it was created, in one statement"""
+    with storage.transaction(conn) as cursor:
+        cursor.execute("""
+            UPDATE budgets SET used_amount = COALESCE((
+                SELECT SUM(e.amount) FROM expenses e
+                WHERE e.username = budgets.username AND e.category = budgets.category AND e.date >= budgets.created_at
+            ), 0)
+        """)
+        reconciled = cursor.rowcount
+        cursor.execute("UPDATE account_balances SET version = version + 1 WHERE username IN (SELECT username FROM budgets)")
+    return reconciled
+
+def fetch_budgets(cursor, username):
+    cursor.execute("""
+        SELECT id, category, monthly_limit, used_amount, created_at, updated_at 
+        FROM budgets 
+        WHERE username = ?
+    """, (username,))
+    rows = cursor.fetchall()
+
+    return [
+        {
+            "id": row[0],
+            "category": row[1],
+            "monthly_limit": float(row[2]),
+            "used_amount": float(row[3]),
+            "exceeded": float(row[3]) > float(row[2]),  # Add exceeded flag
+            "created_at": row[4].strftime("%Y-%m-%d %H:%M:%S"),
+            "updated_at": row[5].strftime("%Y-%m-%d %H:%M:%S")
+        } for row in rows if row[1] in allowed_categories
+    ]
+
 @budget_bp.route("/api/v1.0/budgets", methods=["GET"])
 @login_required
+@etag_per_user
 def get_budgets(username):
+    conn = get_conn()
+    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT id, category, monthly_limit, used_amount, created_at, updated_at 
-            FROM budgets 
-            WHERE username = ?
-        """, (username,))
-        rows = cursor.fetchall()
-
-        budgets = [
-            {
-                "id": row[0],
-                "category": row[1],
-                "monthly_limit": float(row[2]),
-                "used_amount": float(row[3]),
-                "exceeded": float(row[3]) > float(row[2]),  # Add exceeded flag
-                "created_at": row[4].strftime("%Y-%m-%d %H:%M:%S"),
-                "updated_at": row[5].strftime("%Y-%m-%d %H:%M:%S")
-            } for row in rows if row[1] in allowed_categories
-        ]
-        return make_response(jsonify(budgets), 200)
+        return make_response(jsonify(fetch_budgets(cursor, username)), 200)
     except Exception as e:
         return make_response(jsonify({"error": str(e)}), 500)
 
 @budget_bp.route("/api/v1.0/budgets", methods=["POST"])
 @login_required
 def add_budget(username):
+    conn = get_conn()
+    cursor = conn.cursor()
     data = request.json if request.is_json else request.form.to_dict()
 
     category = data.get("category")
@@ -61,11 +103,12 @@ def add_budget(username):
 
         new_id = str(uuid.uuid4())
         now_str = now.strftime("%Y-%m-%d %H:%M:%S")
-        cursor.execute(
-            "INSERT INTO budgets (id, username, category, monthly_limit, used_amount, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (new_id, username, category, float(limit), 0.0, now_str, now_str)
-        )
-        conn.commit()
+        with storage.transaction(conn) as cursor:
+            cursor.execute(
+                "INSERT INTO budgets (id, username, category, monthly_limit, used_amount, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (new_id, username, category, float(limit), 0.0, now_str, now_str)
+            )
+            rollups.bump_version(cursor, username)
         return make_response(jsonify({"message": "Budget created", "id": new_id}), 201)
     except Exception as e:
         return make_response(jsonify({"error": str(e)}), 500)
@@ -73,6 +116,8 @@ def add_budget(username):
 @budget_bp.route("/api/v1.0/budgets/<string:id>", methods=["PUT"])
 @login_required
 def update_budget(id, username):
+    conn = get_conn()
+    cursor = conn.cursor()
     data = request.json if request.is_json else request.form.to_dict()
     limit = data.get("monthly_limit")
     category = data.get("category")
@@ -91,18 +136,19 @@ def update_budget(id, username):
             return make_response(jsonify({"error": "Budget not found or unauthorized"}), 404)
 
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        if category:
-            cursor.execute(
-                "UPDATE budgets SET category = ?, monthly_limit = ?, updated_at = ? WHERE id = ? AND username = ?",
-                (category, float(limit), now, id, username)
-            )
-        else:
-            cursor.execute(
-                "UPDATE budgets SET monthly_limit = ?, updated_at = ? WHERE id = ? AND username = ?",
-                (float(limit), now, id, username)
-            )
+        with storage.transaction(conn) as cursor:
+            if category:
+                cursor.execute(
+                    "UPDATE budgets SET category = ?, monthly_limit = ?, updated_at = ? WHERE id = ? AND username = ?",
+                    (category, float(limit), now, id, username)
+                )
+            else:
+                cursor.execute(
+                    "UPDATE budgets SET monthly_limit = ?, updated_at = ? WHERE id = ? AND username = ?",
+                    (float(limit), now, id, username)
+                )
+            rollups.bump_version(cursor, username)
 
-        conn.commit()
         return make_response(jsonify({"message": "Budget updated"}), 200)
     except Exception as e:
         return make_response(jsonify({"error": str(e)}), 500)
@@ -111,11 +157,15 @@ def update_budget(id, username):
 @budget_bp.route("/api/v1.0/budgets/<string:id>", methods=["DELETE"])
 @login_required
 def delete_budget(id, username):
+    conn = get_conn()
     try:
-        cursor.execute("DELETE FROM budgets WHERE id = ? AND username = ?", (id, username))
-        conn.commit()
+        with storage.transaction(conn) as cursor:
+            cursor.execute("DELETE FROM budgets WHERE id = ? AND username = ?", (id, username))
+            deleted = cursor.rowcount
+            if deleted:
+                rollups.bump_version(cursor, username)
 
-        if cursor.rowcount > 0:
+        if deleted > 0:
             return make_response(jsonify({"message": "Budget deleted"}), 204)
         else:
             return make_response(jsonify({"error": "Budget not found or unauthorized"}), 404)
@@ -0,0 +1,82 @@
+from flask import Blueprint, request, jsonify, make_response
+from globals import get_conn
+from decorators import login_required, etag_per_user, cached_per_user, uses_model
+import rollups
+from blueprints.totalsalaries.totalsalaries import balance_summary
+from blueprints.budget.budget import fetch_budgets
+from blueprints.ML.forecast_api import forecast_next_month, cached_forecast
+from blueprints.ML.model_registry import ModelNotReady
+from blueprints.ML.timeseries import forecast_users
+
+dashboard_bp = Blueprint('dashboard_bp', __name__)
+
+SECTIONS = ["balance", "summary", "monthly", "budgets", "prediction", "forecast"]
+ROLLUP_SECTIONS = {"balance", "summary", "monthly", "prediction", "forecast"}
+FORECAST_HORIZON = 3
+
+def build_rollup_sections(username, rows, wanted):
+    """balance, summary, monthly, prediction and forecast all come from the same monthly_rollups rows"""
+    totals = {}
+    by_category = {}
+    by_month = {}
+    latest_month = {}
+    latest = {}
+    # rows are ordered newest month first
+    for month, kind, category, total in rows:
+        total = float(total)
+        totals[kind] = totals.get(kind, 0) + total
+        if kind == rollups.EXPENSE:
+            if category:
+                by_category[category] = by_category.get(category, 0) + total
+            by_month[month] = by_month.get(month, 0) + total
+        if latest_month.setdefault(kind, month) == month:
+            latest[kind] = latest.get(kind, 0) + total
+
+    sections = {}
+    if "balance" in wanted:
+        sections["balance"] = balance_summary(totals)
+    if "summary" in wanted:
+        sections["summary"] = {category: round(total, 2) for category, total in by_category.items()}
+    if "monthly" in wanted:
+        sections["monthly"] = [{"month": month, "amount": round(by_month[month], 2)} for month in sorted(by_month)]
+    if "prediction" in wanted:
+        try:
+            sections["prediction"] = cached_forecast(username, lambda: forecast_next_month(
+                round(latest.get(rollups.INCOME, 0.0), 2),
+                round(latest.get(rollups.EXPENSE, 0.0), 2),
+                round(latest.get(rollups.SAVING, 0.0), 2),
+            ))
+        except ModelNotReady as e:
+            sections["prediction"] = {"error": str(e)}
+    if "forecast" in wanted:
+        rows = [(username, kind, category, month, total) for month, kind, category, total in rows]
+        sections["forecast"] = forecast_users(rows, FORECAST_HORIZON).get(username)
+    return sections
+
+@dashboard_bp.route("/api/v1.0/dashboard", methods=["GET"])
+@login_required
+@etag_per_user
+@cached_per_user
+@uses_model
+def dashboard(username):
+    """GET: balance, expense summaries, budgets and prediction in one response; ?sections= picks a subset"""
+    requested = request.args.get("sections")
+    wanted = [s.strip() for s in requested.split(",") if s.strip()] if requested else SECTIONS
+    unknown = [s for s in wanted if s not in SECTIONS]
+    if unknown:
+        return make_response(jsonify({"error": f"Unknown sections: {', '.join(unknown)}", "sections": SECTIONS}), 400)
+
+    try:
+        cursor = get_conn().cursor()
+        result = {}
+        if ROLLUP_SECTIONS.intersection(wanted):
+            cursor.execute(
+                "SELECT month, kind, category, total FROM monthly_rollups WHERE username = ? ORDER BY month DESC",
+                (username,)
+            )
+            result.update(build_rollup_sections(username, cursor.fetchall(), wanted))
+        if "budgets" in wanted:
+            result["budgets"] = fetch_budgets(cursor, username)
+        return make_response(jsonify(result), 200)
+    except Exception as e:
+        return make_response(jsonify({"error": str(e)}), 500)
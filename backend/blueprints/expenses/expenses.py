@@ -1,8 +1,14 @@
 import uuid
 from flask import Blueprint, request, jsonify, make_response, url_for
 from datetime import datetime
-from globals import cursor, conn  
-from decorators import jwt_required 
+import pandas as pd
+from globals import get_conn, storage
+from bulk_import import read_bulk_rows, validate_rows, insert_rows
+from pagination import page_size_arg, seek_page, paginated_response
+from mutations import update_owned_row, delete_owned_row
+import rollups
+from blueprints.budget.budget import adjust_used_amount, adjust_used_amounts
+from decorators import jwt_required, etag_per_user
 
 expense_bp = Blueprint('expense_bp', __name__)
 
@@ -11,17 +17,19 @@ allowed_descriptions = ['Movie', 'Shopping', 'Bus Fare', 'Dinner', 'Electricity
 
 @expense_bp.route("/api/v1.0/expenses", methods=["GET"])
 @jwt_required
+@etag_per_user
 def show_all_expenses(username):
+    conn = get_conn()
+    cursor = conn.cursor()
     try:
-        page_num = int(request.args.get('pn', 1))
-        page_size = int(request.args.get('ps', 10))
-        offset = (page_num - 1) * page_size
-
-        cursor.execute(
-            "SELECT id, description, amount, category, date FROM expenses WHERE username = ? ORDER BY id OFFSET ? ROWS FETCH NEXT ? ROWS ONLY",
-            (username, offset, page_size)
-        )
-        expenses = cursor.fetchall()
+        page_size = page_size_arg()
+        try:
+            expenses, next_cursor = seek_page(
+                cursor, storage, "id, description, amount, category, date", "expenses",
+                username, request.args.get('cursor'), page_size
+            )
+        except ValueError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
 
         data_to_return = [{
             "id": row[0],
@@ -31,13 +39,16 @@ def show_all_expenses(username):
             "date": row[4].strftime("%Y-%m-%d %H:%M:%S") if isinstance(row[4], datetime) else str(row[4])
         } for row in expenses]
 
-        return make_response(jsonify(data_to_return), 200)
+        return paginated_response(data_to_return, next_cursor, page_size)
     except Exception as e:
         return make_response(jsonify({"error": "Database error: " + str(e)}), 500)
 
 @expense_bp.route("/api/v1.0/expenses/<string:id>", methods=["GET"])
 @jwt_required
+@etag_per_user
 def show_one_expense(id, username):
+    conn = get_conn()
+    cursor = conn.cursor()
     try:
         cursor.execute(
             "SELECT id, description, amount, category, date FROM expenses WHERE id = ? AND username = ?",
@@ -61,6 +72,7 @@ def show_one_expense(id, username):
 @expense_bp.route("/api/v1.0/expenses", methods=["POST"])
 @jwt_required
 def add_expense(username):
+    conn = get_conn()
     data = request.form
 
     if "description" in data and "amount" in data and "category" in data:
@@ -78,25 +90,13 @@ def add_expense(username):
         date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         try:
-            cursor.execute(
-                "INSERT INTO expenses (id, description, amount, category, date, username) VALUES (?, ?, ?, ?, ?, ?)",
-                (new_id, description, amount, category, date, username)
-            )
-            conn.commit()
-
-            cursor.execute(
-                "SELECT used_amount FROM budgets WHERE username = ? AND category = ?",
-                (username, category)
-            )
-            budget = cursor.fetchone()
-            if budget:
-                current_used = budget[0] if budget[0] is not None else 0.0
-                new_used = float(current_used) + amount
+            with storage.transaction(conn) as cursor:
                 cursor.execute(
-                    "UPDATE budgets SET used_amount = ? WHERE username = ? AND category = ?",
-                    (new_used, username, category)
+                    "INSERT INTO expenses (id, description, amount, category, date, username) VALUES (?, ?, ?, ?, ?, ?)",
+                    (new_id, description, amount, category, date, username)
                 )
-                conn.commit()
+                adjust_used_amount(cursor, username, category, date, amount)
+                rollups.record(cursor, username, rollups.EXPENSE, category, date, amount)
 
             return make_response(jsonify({"message": "Expense added", "id": new_id}), 201)
         except Exception as e:
@@ -104,15 +104,40 @@ def add_expense(username):
     else:
         return make_response(jsonify({"error": "Missing required fields"}), 400)
 
+@expense_bp.route("/api/v1.0/expenses/bulk", methods=["POST"])
+@jwt_required
+def bulk_add_expenses(username):
+    try:
+        df = read_bulk_rows()
+    except (ValueError, pd.errors.ParserError) as e:
+        return make_response(jsonify({"error": str(e)}), 400)
+
+    df, errors = validate_rows(
+        df, ["description", "amount", "category"],
+        allowed={"description": allowed_descriptions, "category": allowed_categories}
+    )
+    if errors:
+        return make_response(jsonify({"error": "Invalid rows", "rows": errors}), 400)
+
+    df["username"] = username
+    conn = get_conn()
+    try:
+        with storage.transaction(conn) as cursor:
+            inserted = insert_rows(cursor, storage, "expenses", df, ["id", "description", "amount", "category", "date", "username"])
+            adjust_used_amounts(cursor, username, df)
+            rollups.record_frame(cursor, username, rollups.EXPENSE, df, "category")
+        return make_response(jsonify({"message": "Expenses imported", "inserted": inserted}), 201)
+    except storage.IntegrityError as e:
+        return make_response(jsonify({"error": "Duplicate or invalid rows: " + str(e)}), 409)
+    except Exception as e:
+        return make_response(jsonify({"error": "Database error: " + str(e)}), 500)
+
 @expense_bp.route("/api/v1.0/expenses/<string:id>", methods=["PUT"])
 @jwt_required
 def edit_expense(id, username):
+    conn = get_conn()
     data = request.form
 
-    cursor.execute("SELECT COUNT(*) FROM expenses WHERE id = ? AND username = ?", (id, username))
-    if cursor.fetchone()[0] == 0:
-        return make_response(jsonify({"error": "Expense not found or unauthorized"}), 404)
-
     if "description" in data and "amount" in data and "category" in data:
         if data["description"] not in allowed_descriptions or data["category"] not in allowed_categories:
             return make_response(jsonify({"error": "Invalid description or category"}), 400)
@@ -127,11 +152,20 @@ def edit_expense(id, username):
         date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         try:
-            cursor.execute(
-                "UPDATE expenses SET description = ?, amount = ?, category = ?, date = ? WHERE id = ? AND username = ?",
-                (description, amount, category, date, id, username)
-            )
-            conn.commit()
+            with storage.transaction(conn) as cursor:
+                old = update_owned_row(
+                    cursor, "expenses", id, username, ("amount", "category", "date"),
+                    {"description": description, "amount": amount, "category": category, "date": date}
+                )
+                if old is not None:
+                    old_amount, old_category, old_date = float(old[0]), old[1], old[2]
+                    rollups.unrecord(cursor, username, rollups.EXPENSE, old_category, old_date, old_amount)
+                    rollups.record(cursor, username, rollups.EXPENSE, category, date, amount)
+                    adjust_used_amount(cursor, username, old_category, old_date, -old_amount)
+                    adjust_used_amount(cursor, username, category, date, amount)
+
+            if old is None:
+                return make_response(jsonify({"error": "Expense not found or unauthorized"}), 404)
             return make_response(jsonify({"message": "Expense updated"}), 200)
         except Exception as e:
             return make_response(jsonify({"error": "Database error: " + str(e)}), 500)
@@ -141,10 +175,16 @@ def edit_expense(id, username):
 @expense_bp.route("/api/v1.0/expenses/<string:id>", methods=["DELETE"])
 @jwt_required
 def delete_expense(id, username):
+    conn = get_conn()
     try:
-        cursor.execute("DELETE FROM expenses WHERE id = ? AND username = ?", (id, username))
-        conn.commit()
-        if cursor.rowcount > 0:
+        with storage.transaction(conn) as cursor:
+            old = delete_owned_row(cursor, "expenses", id, username, ("amount", "category", "date"))
+            if old is not None:
+                old_amount, old_category, old_date = float(old[0]), old[1], old[2]
+                adjust_used_amount(cursor, username, old_category, old_date, -old_amount)
+                rollups.unrecord(cursor, username, rollups.EXPENSE, old_category, old_date, old_amount)
+
+        if old is not None:
             return make_response(jsonify({}), 204)
         else:
             return make_response(jsonify({"error": "Expense not found or unauthorized"}), 404)
@@ -1,118 +1,143 @@
-from flask import Blueprint, jsonify, make_response
-from globals import cursor, conn
-from datetime import datetime
-from decorators import jwt_required
+from flask import Blueprint, request, jsonify, make_response
+from globals import get_conn, storage
+from datetime import datetime, timedelta
+from decorators import jwt_required, etag_per_user, cached_per_user
+import rollups
 
 expense_graph_bp = Blueprint('expense_graph_bp', __name__)
 
-def parse_date(date_input):
-    """Helper function to handle both string and datetime dates"""
-    if isinstance(date_input, datetime):
-        return date_input
-    try:
-        return datetime.strptime(date_input, '%Y-%m-%d')
-    except (TypeError, ValueError):
-        return None
+def parse_bound(value, upper=False):
+    """Parse a ?from=/?to= value (YYYY-MM-DD or YYYY-MM); upper bounds become exclusive"""
+    for fmt, is_month in (('%Y-%m-%d', False), ('%Y-%m', True)):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if not upper:
+            return parsed
+        if is_month:
+            return (parsed.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return parsed + timedelta(days=1)
+    raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD or YYYY-MM")
+
+def expense_source(username):
+    """Where to aggregate the user's expenses from: (table, month, amount, where, params).
+
+    Whole-month ranges are answered from monthly_rollups; a day-level from/to
+    falls back to scanning the expenses table.
+    """
+    bounds = {key: request.args.get(key) for key in ('from', 'to') if request.args.get(key)}
+    parsed = {key: parse_bound(value, upper=(key == 'to')) for key, value in bounds.items()}
+
+    if all(len(value) == 7 for value in bounds.values()):
+        where = "username = ? AND kind = ?"
+        params = [username, rollups.EXPENSE]
+        if 'from' in bounds:
+            where += " AND month >= ?"
+            params.append(bounds['from'])
+        if 'to' in bounds:
+            where += " AND month <= ?"
+            params.append(bounds['to'])
+        return "monthly_rollups", "month", "total", where, params
+
+    where = "username = ?"
+    params = [username]
+    if 'from' in parsed:
+        where += " AND date >= ?"
+        params.append(parsed['from'])
+    if 'to' in parsed:
+        where += " AND date < ?"
+        params.append(parsed['to'])
+    return "expenses", storage.month_expr("date"), "amount", where, params
 
 @expense_graph_bp.route("/api/v1.0/expenses/summary", methods=["GET"])
 @jwt_required
+@etag_per_user
+@cached_per_user
 def expense_summary(username):
     """GET: Return total amount spent per category for the logged-in user"""
     try:
-        cursor.execute("SELECT category, amount FROM expenses WHERE username = ?", (username,))
-        expenses = cursor.fetchall()
-        
-        if not expenses:
+        table, month, amount, where, params = expense_source(username)
+    except ValueError as e:
+        return make_response(jsonify({"error": str(e)}), 400)
+
+    try:
+        cursor = get_conn().cursor()
+        cursor.execute(f"""
+            SELECT category, SUM({amount}) FROM {table}
+            WHERE {where} AND category IS NOT NULL AND category <> ''
+            GROUP BY category
+        """, params)
+        rows = cursor.fetchall()
+
+        if not rows:
             return make_response(jsonify({"error": "No expenses found"}), 404)
-        
-        summary = {}
-        for category, amount in expenses:
-            if not category:
-                continue
-            if category not in summary:
-                summary[category] = 0.0
-            try:
-                summary[category] += float(amount)
-            except (TypeError, ValueError):
-                continue
-                
+
+        summary = {category: float(total) for category, total in rows}
         return make_response(jsonify(summary), 200)
-        
+
     except Exception as e:
         return make_response(jsonify({"error": str(e)}), 500)
 
 @expense_graph_bp.route("/api/v1.0/expenses/monthly", methods=["GET"])
 @jwt_required
+@etag_per_user
+@cached_per_user
 def monthly_summary(username):
     """GET: Return total expenses per month (format: YYYY-MM) for the logged-in user"""
     try:
-        cursor.execute("SELECT date, amount FROM expenses WHERE username = ? ORDER BY date", (username,))
-        expenses = cursor.fetchall()
-        
-        if not expenses:
+        table, month, amount, where, params = expense_source(username)
+    except ValueError as e:
+        return make_response(jsonify({"error": str(e)}), 400)
+
+    try:
+        cursor = get_conn().cursor()
+        cursor.execute(f"""
+            SELECT {month} AS month, SUM({amount}) FROM {table}
+            WHERE {where}
+            GROUP BY {month}
+            ORDER BY month
+        """, params)
+        rows = cursor.fetchall()
+
+        if not rows:
             return make_response(jsonify({"error": "No expenses found"}), 404)
-        
-        monthly_data = {}
-        for date_value, amount in expenses:
-            date_obj = parse_date(date_value)
-            if not date_obj:
-                continue
-                
-            month_key = date_obj.strftime('%Y-%m')
-            
-            try:
-                amount_float = float(amount)
-            except (TypeError, ValueError):
-                continue
-                
-            if month_key not in monthly_data:
-                monthly_data[month_key] = 0.0
-            monthly_data[month_key] += amount_float
-        
-        result = [{"month": month, "amount": total} 
-                 for month, total in sorted(monthly_data.items())]
-        
+
+        result = [{"month": month, "amount": float(total)} for month, total in rows]
         return make_response(jsonify(result), 200)
-        
+
     except Exception as e:
         return make_response(jsonify({"error": str(e)}), 500)
-    
+
 @expense_graph_bp.route("/api/v1.0/expenses/monthly-category", methods=["GET"])
 @jwt_required
+@etag_per_user
+@cached_per_user
 def monthly_category_summary(username):
     """GET: Return total expenses per category per month (format: YYYY-MM) for the logged-in user"""
     try:
-        cursor.execute("SELECT date, category, amount FROM expenses WHERE username = ? ORDER BY date", (username,))
+        table, month, amount, where, params = expense_source(username)
+    except ValueError as e:
+        return make_response(jsonify({"error": str(e)}), 400)
+
+    try:
+        cursor = get_conn().cursor()
+        cursor.execute(f"""
+            SELECT {month} AS month, category, SUM({amount}) FROM {table}
+            WHERE {where} AND category IS NOT NULL AND category <> ''
+            GROUP BY {month}, category
+            ORDER BY month, category
+        """, params)
         rows = cursor.fetchall()
-        
+
         if not rows:
             return make_response(jsonify({"error": "No expenses found"}), 404)
-        
-        monthly_category_data = {}
-        
-        for date_value, category, amount in rows:
-            date_obj = parse_date(date_value)
-            if not date_obj or not category:
-                continue
-            
-            month_key = date_obj.strftime('%Y-%m')
-            key = (month_key, category)
-
-            try:
-                amount_float = float(amount)
-            except (TypeError, ValueError):
-                continue
-
-            if key not in monthly_category_data:
-                monthly_category_data[key] = 0.0
-            monthly_category_data[key] += amount_float
-        
+
         result = [
-            {"month": month, "category": category, "total": total}
-            for (month, category), total in sorted(monthly_category_data.items())
+            {"month": month, "category": category, "total": float(total)}
+            for month, category, total in rows
         ]
-        
         return make_response(jsonify(result), 200)
-    
+
     except Exception as e:
         return make_response(jsonify({"error": str(e)}), 500)
@@ -1,23 +1,30 @@
 import uuid
 from flask import Blueprint, request, jsonify, make_response, url_for
 from datetime import datetime
-from globals import cursor, conn  
-from decorators import login_required 
+import pandas as pd
+from globals import get_conn, storage
+from bulk_import import read_bulk_rows, validate_rows, insert_rows
+from pagination import page_size_arg, seek_page, paginated_response
+from mutations import update_owned_row, delete_owned_row
+import rollups
+from decorators import login_required, etag_per_user
 
 salaries_bp = Blueprint('salaries_bp', __name__)
 
 @salaries_bp.route("/api/v1.0/salaries", methods=["GET"])
 @login_required
+@etag_per_user
 def show_all_salaries(username):
-    page_num = int(request.args.get('pn', 1))
-    page_size = int(request.args.get('ps', 10))
-    offset = (page_num - 1) * page_size
-
-    cursor.execute(
-        "SELECT id, name, amount, date FROM salaries WHERE username = ? ORDER BY id OFFSET ? ROWS FETCH NEXT ? ROWS ONLY",
-        (username, offset, page_size)
-    )
-    salaries = cursor.fetchall()
+    conn = get_conn()
+    cursor = conn.cursor()
+    page_size = page_size_arg()
+    try:
+        salaries, next_cursor = seek_page(
+            cursor, storage, "id, name, amount, date", "salaries",
+            username, request.args.get('cursor'), page_size
+        )
+    except ValueError as e:
+        return make_response(jsonify({"error": str(e)}), 400)
 
     data_to_return = [{
         "id": row[0],
@@ -26,11 +33,14 @@ def show_all_salaries(username):
         "date": row[3].strftime("%Y-%m-%d %H:%M:%S") if isinstance(row[3], datetime) else str(row[3])
     } for row in salaries]
 
-    return make_response(jsonify(data_to_return), 200)
+    return paginated_response(data_to_return, next_cursor, page_size)
 
 @salaries_bp.route("/api/v1.0/salaries/<string:id>", methods=["GET"])
 @login_required
+@etag_per_user
 def show_one_salary(id, username):
+    conn = get_conn()
+    cursor = conn.cursor()
     cursor.execute(
         "SELECT id, name, amount, date FROM salaries WHERE id = ? AND username = ?",
         (id, username)
@@ -51,6 +61,7 @@ def show_one_salary(id, username):
 @salaries_bp.route("/api/v1.0/salaries", methods=["POST"])
 @login_required
 def add_salary(username):
+    conn = get_conn()
     data = request.json if request.is_json else request.form.to_dict()
 
     if "name" in data and "amount" in data:
@@ -59,38 +70,64 @@ def add_salary(username):
         amount = float(data["amount"])
         date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        cursor.execute(
-            "INSERT INTO salaries (id, name, amount, date, username) VALUES (?, ?, ?, ?, ?)",
-            (new_id, name, amount, date, username)
-        )
-        conn.commit()
+        with storage.transaction(conn) as cursor:
+            cursor.execute(
+                "INSERT INTO salaries (id, name, amount, date, username) VALUES (?, ?, ?, ?, ?)",
+                (new_id, name, amount, date, username)
+            )
+            rollups.record(cursor, username, rollups.INCOME, None, date, amount)
 
         return make_response(jsonify({"message": "Salary added", "id": new_id, "date": date}), 201)
     else:
         return make_response(jsonify({"error": "Missing required fields"}), 400)
 
+@salaries_bp.route("/api/v1.0/salaries/bulk", methods=["POST"])
+@login_required
+def bulk_add_salaries(username):
+    try:
+        df = read_bulk_rows()
+    except (ValueError, pd.errors.ParserError) as e:
+        return make_response(jsonify({"error": str(e)}), 400)
+
+    df, errors = validate_rows(df, ["name", "amount"])
+    if errors:
+        return make_response(jsonify({"error": "Invalid rows", "rows": errors}), 400)
+
+    df["username"] = username
+    conn = get_conn()
+    try:
+        with storage.transaction(conn) as cursor:
+            inserted = insert_rows(cursor, storage, "salaries", df, ["id", "name", "amount", "date", "username"])
+            rollups.record_frame(cursor, username, rollups.INCOME, df)
+        return make_response(jsonify({"message": "Salaries imported", "inserted": inserted}), 201)
+    except storage.IntegrityError as e:
+        return make_response(jsonify({"error": "Duplicate or invalid rows: " + str(e)}), 409)
+    except Exception as e:
+        return make_response(jsonify({"error": "Database error: " + str(e)}), 500)
+
 @salaries_bp.route("/api/v1.0/salaries/<string:id>", methods=["PUT"])
 @login_required
 def edit_salary(id, username):
+    conn = get_conn()
     data = request.json if request.is_json else request.form.to_dict()
 
-    # Check ownership
-    cursor.execute("SELECT COUNT(*) FROM salaries WHERE id = ? AND username = ?", (id, username))
-    exists = cursor.fetchone()[0]
-
-    if exists == 0:
-        return make_response(jsonify({"error": "Salary not found or unauthorized"}), 404)
-
     if "name" in data and "amount" in data:
         name = data["name"]
         amount = float(data["amount"])
         date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        cursor.execute(
-            "UPDATE salaries SET name = ?, amount = ?, date = ? WHERE id = ? AND username = ?",
-            (name, amount, date, id, username)
-        )
-        conn.commit()
+        with storage.transaction(conn) as cursor:
+            # Also checks ownership
+            old = update_owned_row(
+                cursor, "salaries", id, username, ("amount", "date"),
+                {"name": name, "amount": amount, "date": date}
+            )
+            if old is not None:
+                rollups.unrecord(cursor, username, rollups.INCOME, None, old[1], float(old[0]))
+                rollups.record(cursor, username, rollups.INCOME, None, date, amount)
+
+        if old is None:
+            return make_response(jsonify({"error": "Salary not found or unauthorized"}), 404)
 
         edited_salary_link = url_for('salaries_bp.show_one_salary', id=id, _external=True)
         return make_response(jsonify({"message": "Salary updated", "url": edited_salary_link}), 200)
@@ -100,10 +137,13 @@ def edit_salary(id, username):
 @salaries_bp.route("/api/v1.0/salaries/<string:id>", methods=["DELETE"])
 @login_required
 def delete_salary(id, username):
-    cursor.execute("DELETE FROM salaries WHERE id = ? AND username = ?", (id, username))
-    conn.commit()
+    conn = get_conn()
+    with storage.transaction(conn) as cursor:
+        old = delete_owned_row(cursor, "salaries", id, username, ("amount", "date"))
+        if old is not None:
+            rollups.unrecord(cursor, username, rollups.INCOME, None, old[1], float(old[0]))
 
-    if cursor.rowcount > 0:
+    if old is not None:
         return make_response(jsonify({}), 204)
     else:
         return make_response(jsonify({"error": "Salary not found or unauthorized"}), 404)
@@ -1,9 +1,13 @@
 import uuid
 from flask import Blueprint, request, jsonify, make_response, url_for
 from datetime import datetime
-from globals import cursor, conn  
-from pyodbc import IntegrityError  
-from decorators import login_required  
+import pandas as pd
+from globals import get_conn, storage
+from bulk_import import read_bulk_rows, validate_rows, insert_rows
+from pagination import page_size_arg, seek_page, paginated_response
+from mutations import update_owned_row, delete_owned_row
+import rollups
+from decorators import login_required, etag_per_user
 
 saving_bp = Blueprint('saving_bp', __name__)
 
@@ -11,16 +15,18 @@ allowed_statuses = ['completed', 'ongoing', 'save']
 
 @saving_bp.route("/api/v1.0/saving_goals", methods=["GET"])
 @login_required
+@etag_per_user
 def show_all_saving_goals(username):
-    page_num = int(request.args.get('pn', 1))
-    page_size = int(request.args.get('ps', 10))
-    offset = (page_num - 1) * page_size
-
-    cursor.execute(
-        "SELECT id, description, amount, category, status, date FROM saving_goals WHERE username = ? ORDER BY id OFFSET ? ROWS FETCH NEXT ? ROWS ONLY",
-        (username, offset, page_size)
-    )
-    saving_goals = cursor.fetchall()
+    conn = get_conn()
+    cursor = conn.cursor()
+    page_size = page_size_arg()
+    try:
+        saving_goals, next_cursor = seek_page(
+            cursor, storage, "id, description, amount, category, status, date", "saving_goals",
+            username, request.args.get('cursor'), page_size
+        )
+    except ValueError as e:
+        return make_response(jsonify({"error": str(e)}), 400)
 
     data_to_return = [{
         "id": str(row[0]),
@@ -31,11 +37,14 @@ def show_all_saving_goals(username):
         "date": row[5].strftime("%Y-%m-%d %H:%M:%S") if isinstance(row[5], datetime) else str(row[5])
     } for row in saving_goals]
 
-    return make_response(jsonify(data_to_return), 200)
+    return paginated_response(data_to_return, next_cursor, page_size)
 
 @saving_bp.route("/api/v1.0/saving_goals/<string:id>", methods=["GET"])
 @login_required
+@etag_per_user
 def show_one_saving_goal(id, username):
+    conn = get_conn()
+    cursor = conn.cursor()
     cursor.execute(
         "SELECT id, description, amount, category, status, date FROM saving_goals WHERE id = ? AND username = ?",
         (id, username)
@@ -58,6 +67,7 @@ def show_one_saving_goal(id, username):
 @saving_bp.route("/api/v1.0/saving_goals", methods=["POST"])
 @login_required
 def add_saving_goal(username):
+    conn = get_conn()
     if request.is_json:
         data = request.json
     else:
@@ -74,33 +84,56 @@ def add_saving_goal(username):
         date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         try:
-            cursor.execute(
-                "INSERT INTO saving_goals (id, description, amount, category, status, date, username) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (new_id, description, amount, category, status, date, username),
-            )
-            conn.commit()
+            with storage.transaction(conn) as cursor:
+                cursor.execute(
+                    "INSERT INTO saving_goals (id, description, amount, category, status, date, username) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (new_id, description, amount, category, status, date, username),
+                )
+                rollups.record(cursor, username, rollups.SAVING, category, date, amount)
             return make_response(jsonify({"message": "Saving goal added", "id": new_id}), 201)
-        except IntegrityError as e:
+        except storage.IntegrityError as e:
             return make_response(jsonify({"error": "Invalid status value"}), 400)
         except Exception as e:
             return make_response(jsonify({"error": str(e)}), 500)
     else:
         return make_response(jsonify({"error": "Missing required fields or invalid status"}), 400)
 
+@saving_bp.route("/api/v1.0/saving_goals/bulk", methods=["POST"])
+@login_required
+def bulk_add_saving_goals(username):
+    try:
+        df = read_bulk_rows()
+    except (ValueError, pd.errors.ParserError) as e:
+        return make_response(jsonify({"error": str(e)}), 400)
+
+    df, errors = validate_rows(
+        df, ["description", "amount", "category", "status"],
+        allowed={"status": allowed_statuses}, defaults={"status": "save"}
+    )
+    if errors:
+        return make_response(jsonify({"error": "Invalid rows", "rows": errors}), 400)
+
+    df["username"] = username
+    conn = get_conn()
+    try:
+        with storage.transaction(conn) as cursor:
+            inserted = insert_rows(cursor, storage, "saving_goals", df, ["id", "description", "amount", "category", "status", "date", "username"])
+            rollups.record_frame(cursor, username, rollups.SAVING, df, "category")
+        return make_response(jsonify({"message": "Saving goals imported", "inserted": inserted}), 201)
+    except storage.IntegrityError as e:
+        return make_response(jsonify({"error": "Duplicate or invalid rows: " + str(e)}), 409)
+    except Exception as e:
+        return make_response(jsonify({"error": "Database error: " + str(e)}), 500)
+
 @saving_bp.route("/api/v1.0/saving_goals/<string:id>", methods=["PUT"])
 @login_required
 def edit_saving_goal(id, username):
+    conn = get_conn()
     if request.is_json:
         data = request.json
     else:
         data = request.form.to_dict()
 
-    cursor.execute("SELECT COUNT(*) FROM saving_goals WHERE id = ? AND username = ?", (id, username))
-    exists = cursor.fetchone()[0]
-
-    if exists == 0:
-        return make_response(jsonify({"error": "Saving goal not found or unauthorized"}), 404)
-
     description = data.get("description")
     amount = data.get("amount")
     category = data.get("category", "")
@@ -108,17 +141,21 @@ def edit_saving_goal(id, username):
     date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     if description and amount:
-        if not status:
-            cursor.execute("SELECT status FROM saving_goals WHERE id = ? AND username = ?", (id, username))
-            status = cursor.fetchone()[0]
-        elif status not in allowed_statuses:
+        if status and status not in allowed_statuses:
             return make_response(jsonify({"error": "Invalid status value"}), 400)
 
-        cursor.execute(
-            "UPDATE saving_goals SET description = ?, amount = ?, category = ?, status = ?, date = ? WHERE id = ? AND username = ?",
-            (description, float(amount), category, status, date, id, username),
-        )
-        conn.commit()
+        updates = {"description": description, "amount": float(amount), "category": category, "date": date}
+        if status:
+            updates["status"] = status  # otherwise keep the current status
+
+        with storage.transaction(conn) as cursor:
+            old = update_owned_row(cursor, "saving_goals", id, username, ("amount", "category", "date"), updates)
+            if old is not None:
+                rollups.unrecord(cursor, username, rollups.SAVING, old[1], old[2], float(old[0]))
+                rollups.record(cursor, username, rollups.SAVING, category, date, float(amount))
+
+        if old is None:
+            return make_response(jsonify({"error": "Saving goal not found or unauthorized"}), 404)
 
         edited_saving_goal_link = url_for('saving_bp.show_one_saving_goal', id=id, _external=True)
         return make_response(jsonify({"message": "Saving goal updated", "url": edited_saving_goal_link}), 200)
@@ -128,10 +165,13 @@ def edit_saving_goal(id, username):
 @saving_bp.route("/api/v1.0/saving_goals/<string:id>", methods=["DELETE"])
 @login_required
 def delete_saving_goal(id, username):
-    cursor.execute("DELETE FROM saving_goals WHERE id = ? AND username = ?", (id, username))
-    conn.commit()
+    conn = get_conn()
+    with storage.transaction(conn) as cursor:
+        old = delete_owned_row(cursor, "saving_goals", id, username, ("amount", "category", "date"))
+        if old is not None:
+            rollups.unrecord(cursor, username, rollups.SAVING, old[1], old[2], float(old[0]))
 
-    if cursor.rowcount > 0:
+    if old is not None:
         return make_response(jsonify({}), 204)
     else:
         return make_response(jsonify({"error": "Invalid saving goal ID or unauthorized"}), 404)
@@ -0,0 +1,93 @@
+import io
+import os
+import uuid
+from datetime import datetime
+import pandas as pd
+from flask import request
+
+MAX_BULK_ROWS = int(os.environ.get('MAX_BULK_ROWS', 100000))
+MAX_REPORTED_ERRORS = 50
+
+
+def read_bulk_rows():
+    """Rows from a JSON array body, a multipart 'file' CSV upload or a text/csv body"""
+    upload = request.files.get('file')
+    if upload is not None:
+        df = pd.read_csv(upload.stream, dtype=str, keep_default_na=False)
+    elif request.mimetype == 'text/csv':
+        df = pd.read_csv(io.BytesIO(request.get_data()), dtype=str, keep_default_na=False)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            raise ValueError("Expected a JSON array of rows or a CSV upload")
+        df = pd.DataFrame.from_records(data)
+
+    if df.empty:
+        raise ValueError("No rows to import")
+    if len(df) > MAX_BULK_ROWS:
+        raise ValueError(f"Too many rows: {len(df)} (max {MAX_BULK_ROWS})")
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+
+def validate_rows(df, required, allowed=None, defaults=None):
+    """Vectorised validation of a bulk upload.
+
+    Returns (clean_df, errors). ``clean_df`` has normalised ``id``, ``amount``
+    and ``date`` columns; ``errors`` lists the first offending rows (1-based,
+    as in the uploaded file) and is empty when every row is valid.
+    """
+    df = df.copy()
+    for col, value in (defaults or {}).items():
+        if col not in df.columns:
+            df[col] = value
+        df[col] = df[col].where(df[col].notna() & (df[col].astype(str) != ""), value)
+
+    missing = [col for col in required if col not in df.columns]
+    if missing:
+        return None, [{"row": None, "error": f"Missing columns: {', '.join(missing)}"}]
+
+    problems = pd.Series("", index=df.index)
+
+    def flag(mask, message):
+        problems[mask & (problems == "")] = message
+
+    for col in required:
+        flag(df[col].isna() | (df[col].astype(str).str.strip() == ""), f"{col} is required")
+
+    df["amount"] = pd.to_numeric(df["amount"], errors="coerce").round(2)
+    flag(df["amount"].isna(), "Invalid amount format")
+
+    for col, values in (allowed or {}).items():
+        flag(~df[col].isin(values), f"Invalid {col}")
+
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if "date" in df.columns:
+        given = df["date"].notna() & (df["date"].astype(str) != "")
+        parsed = pd.to_datetime(df["date"].where(given), errors="coerce", format="mixed")
+        flag(given & parsed.isna(), "Invalid date")
+        df["date"] = parsed.dt.strftime("%Y-%m-%d %H:%M:%S").where(given, now)
+    else:
+        df["date"] = now
+
+    if "id" in df.columns:
+        has_id = df["id"].notna() & (df["id"].astype(str) != "")
+        df["id"] = df["id"].where(has_id, None)
+        flag(has_id & df["id"].duplicated(keep=False), "Duplicate id")
+    else:
+        df["id"] = None
+    no_id = df["id"].isna()
+    df.loc[no_id, "id"] = [str(uuid.uuid4()) for _ in range(int(no_id.sum()))]
+
+    bad = problems[problems != ""]
+    errors = [{"row": int(i) + 1, "error": message} for i, message in bad.head(MAX_REPORTED_ERRORS).items()]
+    if len(bad) > MAX_REPORTED_ERRORS:
+        errors.append({"row": None, "error": f"{len(bad) - MAX_REPORTED_ERRORS} more invalid rows"})
+    return df, errors
+
+
+def insert_rows(cursor, storage, table, df, columns):
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    rows = list(zip(*(df[col].tolist() for col in columns)))
+    storage.executemany(cursor, sql, rows)
+    return len(rows)
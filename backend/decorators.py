@@ -1,7 +1,30 @@
-from flask import request, jsonify, make_response, current_app as app
+from flask import g, request, jsonify, make_response, current_app as app
 from functools import wraps
+import hmac
 import jwt
-from globals import cursor
+from globals import get_conn
+import rollups
+from token_cache import revoked_tokens, verified_tokens, fetch_revoked_tokens, token_id
+from response_cache import response_cache
+from profiling import request_profiler
+
+def decode_token(token, token_type='access'):
+    """Verify a token, skipping the HS256 check for recently seen tokens"""
+    claims = verified_tokens.get(token)
+    if claims is None:
+        claims = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        verified_tokens.put(token, claims)
+    if claims.get('typ', 'access') != token_type:
+        raise jwt.InvalidTokenError(f"Expected a {token_type} token")
+    return claims
+
+def is_revoked(claims, token):
+    if revoked_tokens.claim_refresh():
+        try:
+            revoked_tokens.load(fetch_revoked_tokens(get_conn()))
+        finally:
+            revoked_tokens.release_refresh()
+    return token_id(claims, token) in revoked_tokens
 
 def jwt_required(f):
     @wraps(f)
@@ -11,13 +34,12 @@ def jwt_required(f):
             return make_response(jsonify({'error': 'Token is missing'}), 403)
 
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            data = decode_token(token)
 
         except jwt.InvalidTokenError:
             return make_response(jsonify({'error': 'Token is invalid'}), 403)
 
-        cursor.execute("SELECT COUNT(*) FROM blacklist WHERE token = ?", (token,))
-        if cursor.fetchone()[0] > 0:
+        if is_revoked(data, token):
             return make_response(jsonify({'error': 'Token is blacklisted'}), 403)
 
         return f(*args, **kwargs, username=data['user'])
@@ -32,9 +54,8 @@ def login_required(f):
             if not token:
                 return make_response(jsonify({"error": "Token is missing"}), 401)
 
-            decoded_token = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            cursor.execute("SELECT COUNT(*) FROM blacklist WHERE token = ?", (token,))
-            if cursor.fetchone()[0] > 0:
+            decoded_token = decode_token(token)
+            if is_revoked(decoded_token, token):
                 return make_response(jsonify({"error": "Token is blacklisted"}), 401)
 
             return f(*args, **kwargs, username=decoded_token['user'])
@@ -45,13 +66,95 @@ def login_required(f):
     
     return login_required_wrapper
 
+def operator_required(f):
+    """Operator-only route: needs the OPERATOR_TOKEN shared secret in X-Operator-Token, so it is closed while that is unset"""
+    @wraps(f)
+    def operator_required_wrapper(*args, **kwargs):
+        expected = app.config.get('OPERATOR_TOKEN')
+        supplied = request.headers.get('X-Operator-Token')
+        if expected is None or supplied is None or not hmac.compare_digest(supplied, expected):
+            return make_response(jsonify({"error": "A valid X-Operator-Token is required"}), 403)
+        return f(*args, **kwargs)
+
+    # Dashboards poll these; sampled profiles of them would crowd out real runs
+    operator_required_wrapper.skip_profiling = True
+    return operator_required_wrapper
+
+def profile_token_required(f):
+    """Profile download route: needs the profiler's PROFILE_TOKEN in X-Profile, so it is closed while that is unset"""
+    @wraps(f)
+    def profile_token_required_wrapper(*args, **kwargs):
+        if not request_profiler.authorized(request.headers.get('X-Profile')):
+            return make_response(jsonify({"error": "A valid X-Profile token is required"}), 403)
+        return f(*args, **kwargs)
+
+    return profile_token_required_wrapper
+
+def uses_model(f):
+    """Mark a per-user cached view whose response depends on the forecast model; goes right above the view"""
+    f.uses_model = True
+    return f
+
+def cache_key(username, view=None):
+    key = (
+        username,
+        request.endpoint,
+        tuple(sorted((request.view_args or {}).items())),
+        tuple(sorted(request.args.items(multi=True))),
+    )
+    if getattr(view, 'uses_model', False):
+        key += (response_cache.model_version,)
+    return key
+
+def data_version(username):
+    """The user's data version as every worker sees it; read once per request"""
+    if 'data_version' not in g:
+        g.data_version = rollups.data_version(get_conn().cursor(), username)
+    return g.data_version
+
+def etag_per_user(f):
+    """ETag from the user's data version; a matching If-None-Match gets a 304 without calling f"""
+    @wraps(f)
+    def etag_per_user_wrapper(*args, **kwargs):
+        etag = response_cache.etag(cache_key(kwargs['username'], f), data_version(kwargs['username']))
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('x-access-token')
+        return response
+
+    return etag_per_user_wrapper
+
+def cached_per_user(f):
+    """Serve repeated GETs from response_cache; goes below jwt_required/login_required"""
+    @wraps(f)
+    def cached_per_user_wrapper(*args, **kwargs):
+        key = cache_key(kwargs['username'], f)
+        version = data_version(kwargs['username'])
+        cached = response_cache.get(key, version)
+        if cached is not None:
+            body, status, mimetype = cached
+            return app.response_class(body, status=status, mimetype=mimetype)
+
+        response = make_response(f(*args, **kwargs))
+        if response.status_code == 200:
+            response_cache.put(key, version, (response.get_data(), response.status_code, response.mimetype))
+        return response
+
+    return cached_per_user_wrapper
+
 def log_request(f):
+    """Always write this route's access log line, whatever LOG_SAMPLE_RATE is"""
     @wraps(f)
     def log_request_wrapper(*args, **kwargs):
-        print("Request Headers:", request.headers)
-        print("Request Form Data:", request.form)
+        g.log_always = True
         return f(*args, **kwargs)
-    
+
     return log_request_wrapper
 
 if __name__ == "__main__":
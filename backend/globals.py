@@ -1,11 +1,35 @@
-import pyodbc
+import os
+from flask import g
+from pool import ConnectionPool
+from storage import create_storage
+from query_stats import SQL_INSTRUMENTATION, instrumented
 
-SERVER = '192.168.1.214'  
-DATABASE = 'FinanceDB'    
-USERNAME = 'SA'           
-PASSWORD = 'MyStrongPassword123'  
+SERVER = '192.168.1.214'
+DATABASE = 'FinanceDB'
+USERNAME = 'SA'
+PASSWORD = 'MyStrongPassword123'
+
+DB_BACKEND = os.environ.get('DB_BACKEND', 'sqlserver')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'Database', 'finance.db'))
+
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
 
 conn_str = f'DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={SERVER};DATABASE={DATABASE};UID={USERNAME};PWD={PASSWORD}'
 
-conn = pyodbc.connect(conn_str, autocommit=True)  
-cursor = conn.cursor()
\ No newline at end of file
+storage = create_storage(DB_BACKEND, conn_str=conn_str, sqlite_path=SQLITE_PATH)
+
+connect = instrumented(storage.connect) if SQL_INSTRUMENTATION else storage.connect
+
+pool = ConnectionPool(connect, max_size=POOL_SIZE, timeout=POOL_TIMEOUT, health_check_sql=storage.health_check_sql)
+
+def get_conn():
+    """Connection checked out from the pool for the current request"""
+    if 'db_conn' not in g:
+        g.db_conn = pool.checkout()
+    return g.db_conn
+
+def release_conn(exc=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        pool.checkin(conn)
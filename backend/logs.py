@@ -0,0 +1,147 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# 'json' (one object per line) or 'text'
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+# Fraction of ordinary requests given an access log line; errors and slow requests are always logged
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.05))
+LOG_SLOW_MS = float(os.environ.get('LOG_SLOW_MS', 1000))
+# Include (redacted) headers and a capped body in logged requests
+LOG_REQUEST_DETAILS = os.environ.get('LOG_REQUEST_DETAILS', '0') == '1'
+LOG_BODY_BYTES = int(os.environ.get('LOG_BODY_BYTES', 512))
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+
+REDACTED_HEADERS = {'authorization', 'proxy-authorization', 'cookie', 'x-access-token', 'x-refresh-token', 'x-profile', 'x-operator-token'}
+REDACTED_FIELDS = {'password', 'new_password', 'token', 'refresh_token', 'secret'}
+
+logger = logging.getLogger('access')
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking or raising when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The listener thread does the formatting; only resolve what may not survive the hand-off
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler = None
+_listener = None
+
+
+def configure_logging():
+    """Route the root logger through a bounded queue drained by one background thread"""
+    global _handler, _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    _handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    root = logging.getLogger()
+    root.handlers[:] = [_handler]
+    root.setLevel(LOG_LEVEL)
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def dropped_records():
+    return _handler.dropped if _handler is not None else 0
+
+
+def redact_headers(headers):
+    return {name: '[redacted]' if name.lower() in REDACTED_HEADERS else value for name, value in headers.items()}
+
+
+def redact_fields(data):
+    return {key: '[redacted]' if key.lower() in REDACTED_FIELDS else value for key, value in data.items()}
+
+
+def request_body():
+    """The request payload for a log line: redacted form/JSON fields, or the raw body, capped at LOG_BODY_BYTES"""
+    if request.form:
+        body = json.dumps(redact_fields(request.form.to_dict()))
+    else:
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict):
+            body = json.dumps(redact_fields(payload), default=str)
+        else:
+            body = request.get_data(as_text=True)
+    if len(body) > LOG_BODY_BYTES:
+        return body[:LOG_BODY_BYTES] + f"...[{len(body) - LOG_BODY_BYTES} more]"
+    return body
+
+
+def start_request():
+    g.log_started = time.perf_counter()
+
+
+def log_response(response):
+    """after_request hook: one structured access line for sampled, failed, slow or flagged requests"""
+    started = g.get('log_started')
+    if started is None:
+        return response
+    duration_ms = (time.perf_counter() - started) * 1000
+    status = response.status_code
+    if status < 500 and duration_ms < LOG_SLOW_MS and not g.get('log_always') and random.random() >= LOG_SAMPLE_RATE:
+        return response
+
+    fields = {
+        "method": request.method,
+        "path": request.path,
+        "status": status,
+        "duration_ms": round(duration_ms, 2),
+        "remote_addr": request.remote_addr,
+        "bytes": response.calculate_content_length(),
+    }
+    if LOG_REQUEST_DETAILS:
+        fields["headers"] = redact_headers(request.headers)
+        fields["body"] = request_body()
+    level = logging.ERROR if status >= 500 else logging.WARNING if duration_ms >= LOG_SLOW_MS else logging.INFO
+    logger.log(level, "%s %s %s", request.method, request.path, status, extra={"fields": fields})
+    return response
@@ -0,0 +1,190 @@
+import bisect
+import threading
+import time
+from flask import g, request
+
+# Upper bounds in seconds; the last slot of every histogram counts everything above them
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# SQL statements issued per request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram: one list index increment per observation"""
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def labels(**values):
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in values.items()) + "}"
+
+
+class RequestMetrics:
+    """Request counts, latency histograms and in-flight gauges per Flask endpoint.
+
+    Requests are keyed by ``request.endpoint`` (``blueprint.view``) rather
+    than the URL, so path parameters and unknown URLs cannot grow the label
+    set. ``collectors`` are callables returning extra (name, type, help,
+    [(labels dict, value)]) families, rendered with every scrape.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._responses = {}
+        self._in_flight = {}
+        self._queries = {}
+        self._collectors = []
+        self._started = time.time()
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def start_request(self):
+        endpoint = request.endpoint or "unmatched"
+        g.metrics_request = (endpoint, request.method, time.perf_counter())
+        with self._lock:
+            self._in_flight[endpoint] = self._in_flight.get(endpoint, 0) + 1
+
+    def record_status(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def finish_request(self, exc=None):
+        """teardown_request hook, so requests that raised still get counted (as 500)"""
+        started = g.pop("metrics_request", None)
+        if started is None:
+            return
+        endpoint, method, began = started
+        elapsed = time.perf_counter() - began
+        status = g.pop("metrics_status", 500)
+        queries = g.get("sql_queries", 0)
+        with self._lock:
+            self._in_flight[endpoint] -= 1
+            key = (endpoint, method)
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram(self.buckets)
+            histogram.observe(elapsed)
+            key = (endpoint, method, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+            histogram = self._queries.get(endpoint)
+            if histogram is None:
+                histogram = self._queries[endpoint] = Histogram(QUERY_COUNT_BUCKETS)
+            histogram.observe(queries)
+
+    def init_app(self, app):
+        app.before_request(self.start_request)
+        app.after_request(self.record_status)
+        app.teardown_request(self.finish_request)
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            latency = {key: (list(h.counts), h.sum) for key, h in self._latency.items()}
+            responses = dict(self._responses)
+            in_flight = dict(self._in_flight)
+            queries = {key: (list(h.counts), h.sum) for key, h in self._queries.items()}
+
+        lines = [
+            "# HELP http_requests_total Completed requests by endpoint, method and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (endpoint, method, status), count in sorted(responses.items()):
+            lines.append(f"http_requests_total{labels(endpoint=endpoint, method=method, status=status)} {count}")
+
+        lines += [
+            "# HELP http_request_duration_seconds Request latency by endpoint and method.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (endpoint, method), (counts, total) in sorted(latency.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"http_request_duration_seconds_bucket{labels(endpoint=endpoint, method=method, le=bound)} {cumulative}")
+            lines.append(f"http_request_duration_seconds_sum{labels(endpoint=endpoint, method=method)} {total}")
+            lines.append(f"http_request_duration_seconds_count{labels(endpoint=endpoint, method=method)} {cumulative}")
+
+        lines += [
+            "# HELP http_request_db_queries SQL statements issued per request by endpoint.",
+            "# TYPE http_request_db_queries histogram",
+        ]
+        for endpoint, (counts, total) in sorted(queries.items()):
+            cumulative = 0
+            for bound, count in zip(QUERY_COUNT_BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"http_request_db_queries_bucket{labels(endpoint=endpoint, le=bound)} {cumulative}")
+            lines.append(f"http_request_db_queries_sum{labels(endpoint=endpoint)} {total:g}")
+            lines.append(f"http_request_db_queries_count{labels(endpoint=endpoint)} {cumulative}")
+
+        lines += [
+            "# HELP http_requests_in_flight Requests currently being handled by endpoint.",
+            "# TYPE http_requests_in_flight gauge",
+        ]
+        for endpoint, count in sorted(in_flight.items()):
+            lines.append(f"http_requests_in_flight{labels(endpoint=endpoint)} {count}")
+
+        lines += [
+            "# HELP process_start_time_seconds Start time of the process since the epoch.",
+            "# TYPE process_start_time_seconds gauge",
+            f"process_start_time_seconds {self._started}",
+        ]
+
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception:
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for sample_labels, value in samples:
+                    lines.append(f"{name}{labels(**sample_labels) if sample_labels else ''} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def pool_collector(pool):
+    """Metric families for a ConnectionPool's gauges and counters"""
+    def collect():
+        stats = pool.stats()
+        families = [
+            ("db_pool_connections", "gauge", "Pooled database connections by state.",
+             [({"state": "in_use"}, stats["in_use"]), ({"state": "idle"}, stats["idle"])]),
+            ("db_pool_max_connections", "gauge", "Configured pool size.", [({}, stats["max_size"])]),
+        ]
+        for name in ("created", "checkouts", "waits", "timeouts", "reconnects", "health_check_failures", "discarded"):
+            families.append((f"db_pool_{name}_total", "counter", f"Connection pool {name.replace('_', ' ')}.", [({}, stats[name])]))
+        return families
+
+    return collect
+
+
+def stats_collector(prefix, stats, counters=(), gauges=()):
+    """Metric families read from a component's ``stats()`` dict: ``counters`` become ``<prefix>_<key>_total``"""
+    def collect():
+        values = stats()
+        families = []
+        for key in counters:
+            families.append((f"{prefix}_{key}_total", "counter", f"{prefix} {key.replace('_', ' ')}.", [({}, values[key])]))
+        for key in gauges:
+            families.append((f"{prefix}_{key}", "gauge", f"{prefix} {key.replace('_', ' ')}.", [({}, values[key])]))
+        return families
+
+    return collect
+
+
+request_metrics = RequestMetrics()
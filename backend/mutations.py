@@ -0,0 +1,42 @@
+class ConcurrentModification(Exception):
+    pass
+
+
+def _guarded(cursor, table, id, username, tracked, write, retries=3):
+    """Read ``tracked`` columns of a user's row, then run ``write`` guarded on them.
+
+    Returns the old values, or None if the row does not exist. Retries when
+    another request changed the row between the read and the write.
+    """
+    columns = ", ".join(tracked)
+    guard = " AND ".join(f"{col} = ?" for col in tracked)
+    for _ in range(retries):
+        cursor.execute(f"SELECT {columns} FROM {table} WHERE id = ? AND username = ?", (id, username))
+        old = cursor.fetchone()
+        if old is None:
+            return None
+        write(guard, tuple(old))
+        if cursor.rowcount > 0:
+            return tuple(old)
+    raise ConcurrentModification(f"{table} row {id} was modified concurrently, please retry")
+
+
+def update_owned_row(cursor, table, id, username, tracked, updates):
+    """UPDATE a user's row and return the previous values of ``tracked``"""
+    assignments = ", ".join(f"{col} = ?" for col in updates)
+
+    def write(guard, old):
+        cursor.execute(
+            f"UPDATE {table} SET {assignments} WHERE id = ? AND username = ? AND {guard}",
+            (*updates.values(), id, username, *old)
+        )
+
+    return _guarded(cursor, table, id, username, tracked, write)
+
+
+def delete_owned_row(cursor, table, id, username, tracked):
+    """DELETE a user's row and return the values ``tracked`` had"""
+    def write(guard, old):
+        cursor.execute(f"DELETE FROM {table} WHERE id = ? AND username = ? AND {guard}", (id, username, *old))
+
+    return _guarded(cursor, table, id, username, tracked, write)
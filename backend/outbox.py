@@ -0,0 +1,242 @@
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from globals import pool, storage
+
+logger = logging.getLogger(__name__)
+
+# SMTP credentials only ever come from the environment. Point SMTP_HOST/SMTP_PORT at a local
+# stand-in (e.g. `python -m aiosmtpd -n -l localhost:1025`) with SMTP_STARTTLS=0 and no
+# SMTP_USERNAME to exercise the sender without Gmail.
+SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '1') == '1'
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME', '')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 30))
+MAIL_SENDER = os.environ.get('MAIL_SENDER', SMTP_USERNAME)
+
+
+def enqueue(cursor, recipient, subject, body):
+    """Queue a plain-text email; run it in the transaction of the change that triggers it"""
+    now = datetime.utcnow()
+    message_id = str(uuid.uuid4())
+    cursor.execute(
+        "INSERT INTO email_outbox (id, recipient, subject, body, attempts, next_attempt_at, created_at) VALUES (?, ?, ?, ?, 0, ?, ?)",
+        (message_id, recipient, subject, body, now, now)
+    )
+    return message_id
+
+
+def smtp_connect():
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    if SMTP_STARTTLS:
+        server.starttls()
+    if SMTP_USERNAME:
+        server.login(SMTP_USERNAME, SMTP_PASSWORD)
+    return server
+
+
+class OutboxSender:
+    """Background thread delivering email_outbox rows over one reused SMTP session.
+
+    Due messages are claimed in batches by pushing their next_attempt_at out
+    by ``lease_seconds`` with a guarded UPDATE, so several worker processes
+    can run a sender without double-sending. Failures are retried with
+    exponential backoff and jitter until ``max_attempts``; the SMTP session is
+    closed after ``idle_seconds`` without mail.
+    """
+
+    def __init__(self, pool, connect=smtp_connect, sender=None, batch_size=50, poll_interval=5,
+                 max_attempts=8, backoff_base=30, backoff_max=3600, lease_seconds=120,
+                 idle_seconds=60, retention_days=7):
+        self.pool = pool
+        self.connect = connect
+        self.sender = sender or MAIL_SENDER
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+        self.idle_seconds = idle_seconds
+        self.retention_days = retention_days
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._smtp = None
+        self._last_used = 0.0
+        self._purged_at = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.connects = 0
+
+    def notify(self):
+        """Wake the sender now instead of at the next poll"""
+        self._wake.set()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                while self.send_due() == self.batch_size:
+                    pass
+                if time.monotonic() - self._purged_at > 3600:
+                    self.purge_sent()
+            except Exception as e:
+                logger.exception("Email outbox run failed: %s", e)
+            if self._smtp is not None and time.monotonic() - self._last_used > self.idle_seconds:
+                self._close()
+
+    def _claim(self, conn):
+        now = datetime.utcnow()
+        cursor = conn.cursor()
+        sql, params = storage.paginate(
+            "SELECT id, recipient, subject, body, attempts FROM email_outbox "
+            "WHERE sent_at IS NULL AND attempts < ? AND next_attempt_at <= ? ORDER BY next_attempt_at",
+            (self.max_attempts, now), 0, self.batch_size
+        )
+        cursor.execute(sql, params)
+        claimed = []
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        for message_id, recipient, subject, body, attempts in cursor.fetchall():
+            # Loses to any sender that leased the row after our SELECT
+            cursor.execute(
+                "UPDATE email_outbox SET next_attempt_at = ? WHERE id = ? AND sent_at IS NULL AND next_attempt_at <= ?",
+                (lease_until, message_id, now)
+            )
+            if cursor.rowcount == 1:
+                claimed.append((message_id, recipient, subject, body, attempts))
+        conn.commit()
+        return claimed
+
+    def send_due(self):
+        """Send one batch of due messages; returns how many were claimed"""
+        with self.pool.connection() as conn:
+            batch = self._claim(conn)
+            if not batch:
+                return 0
+
+            cursor = conn.cursor()
+            connect_error = None
+            if self._smtp is None:
+                try:
+                    self._smtp = self.connect()
+                    self.connects += 1
+                    self._last_used = time.monotonic()
+                except Exception as e:
+                    connect_error = e
+
+            for message_id, recipient, subject, body, attempts in batch:
+                try:
+                    if connect_error is not None:
+                        raise connect_error
+                    self._send(recipient, subject, body)
+                except Exception as e:
+                    self.failed += 1
+                    if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                        # Refusals leave the session usable; anything else may not have
+                        self._close()
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** attempts) * random.uniform(0.8, 1.2)
+                    cursor.execute(
+                        "UPDATE email_outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (datetime.utcnow() + timedelta(seconds=delay), str(e)[:500], message_id)
+                    )
+                    if attempts + 1 >= self.max_attempts:
+                        logger.error("Giving up on email %s to %s after %d attempts: %s", message_id, recipient, attempts + 1, e)
+                else:
+                    self.sent += 1
+                    cursor.execute(
+                        "UPDATE email_outbox SET attempts = attempts + 1, sent_at = ?, last_error = NULL WHERE id = ?",
+                        (datetime.utcnow(), message_id)
+                    )
+                conn.commit()
+            return len(batch)
+
+    def _send(self, recipient, subject, body):
+        message = MIMEMultipart()
+        message['From'] = self.sender
+        message['To'] = recipient
+        message['Subject'] = subject
+        message.attach(MIMEText(body, 'plain'))
+
+        for retry in (True, False):
+            if self._smtp is None:
+                self._smtp = self.connect()
+                self.connects += 1
+                self._last_used = time.monotonic()
+            try:
+                self._smtp.sendmail(self.sender, recipient, message.as_string())
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                # The reused session timed out on the server side; reconnect once
+                self._smtp = None
+                if not retry:
+                    raise
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def purge_sent(self):
+        self._purged_at = time.monotonic()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM email_outbox WHERE sent_at < ?",
+                (datetime.utcnow() - timedelta(days=self.retention_days),)
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    def stats(self):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT COUNT(*), SUM(CASE WHEN attempts >= ? THEN 1 ELSE 0 END) FROM email_outbox WHERE sent_at IS NULL",
+                (self.max_attempts,)
+            )
+            pending, dead = cursor.fetchone()
+        return {
+            "pending": pending - (dead or 0),
+            "dead": dead or 0,
+            "sent": self.sent,
+            "failed_attempts": self.failed,
+            "smtp_connects": self.connects,
+            "connected": self._smtp is not None,
+        }
+
+
+outbox_sender = OutboxSender(
+    pool,
+    batch_size=int(os.environ.get('OUTBOX_BATCH_SIZE', 50)),
+    max_attempts=int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8)),
+)
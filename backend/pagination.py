@@ -0,0 +1,65 @@
+import base64
+import json
+import os
+from datetime import datetime
+from flask import request, jsonify, make_response, url_for
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 100))
+
+
+def page_size_arg():
+    """?ps= clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        page_size = int(request.args.get('ps', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        page_size = DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(date, id):
+    raw = json.dumps([date.isoformat(" ") if isinstance(date, datetime) else str(date), id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(date), str(id)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def seek_page(cursor, storage, columns, table, username, after, page_size):
+    """One page of a user's rows, newest first, ordered by (date, id).
+
+    ``columns`` must start with ``id`` and end with ``date`` so the cursor for
+    the next page can be read off the last row. Returns (rows, next_cursor).
+    """
+    sql = f"SELECT {columns} FROM {table} WHERE username = ?"
+    params = (username,)
+    if after:
+        after_date, after_id = decode_cursor(after)
+        sql += " AND (date < ? OR (date = ? AND id < ?))"
+        params += (after_date, after_date, after_id)
+    sql, params = storage.paginate(sql + " ORDER BY date DESC, id DESC", params, 0, page_size + 1)
+
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1][-1], rows[-1][0])
+    return rows, next_cursor
+
+
+def paginated_response(data, next_cursor, page_size):
+    """List body as before; the next page is advertised in X-Next-Cursor and Link"""
+    response = make_response(jsonify(data), 200)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        next_url = url_for(request.endpoint, cursor=next_cursor, ps=page_size, _external=True)
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    return response
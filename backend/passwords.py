@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+HASH_QUEUE_LIMIT = int(os.environ.get('HASH_QUEUE_LIMIT', HASH_WORKERS * 4))
+HASH_WAIT_SECONDS = float(os.environ.get('HASH_WAIT_SECONDS', 5))
+LOGIN_MAX_FAILURES = int(os.environ.get('LOGIN_MAX_FAILURES', 5))
+LOGIN_IP_MAX_FAILURES = int(os.environ.get('LOGIN_IP_MAX_FAILURES', 50))
+LOGIN_WINDOW_SECONDS = float(os.environ.get('LOGIN_WINDOW_SECONDS', 300))
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def hash_rounds(hashed):
+    """Cost factor of a ``$2b$12$...`` bcrypt hash, or None if it is not one"""
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """bcrypt on a small dedicated thread pool instead of the request threads.
+
+    bcrypt releases the GIL, so ``workers`` bounds how many cores hashing can
+    take at once. At most ``queue_limit`` more calls may wait for a worker;
+    beyond that ``HashingBusy`` is raised immediately so a login storm gets
+    fast 503s instead of queueing every request thread behind it.
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=HASH_WORKERS, queue_limit=HASH_QUEUE_LIMIT, wait=HASH_WAIT_SECONDS):
+        self.rounds = rounds
+        self.workers = workers
+        self.wait = wait
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._busy_seconds += time.perf_counter() - started
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy("Too many password checks in progress, try again shortly")
+        with self._lock:
+            self._in_flight += 1
+        future = self._executor.submit(self._timed, fn, *args)
+        # The slot is held until the hash finishes, even if the caller gave up waiting
+        future.add_done_callback(self._done)
+        try:
+            return future.result(self.wait)
+        except FutureTimeout:
+            raise HashingBusy("Password check timed out, try again shortly")
+
+    def _done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+        self._slots.release()
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(self.rounds)
+        return self._run(bcrypt.hashpw, password.encode("utf-8"), salt).decode("utf-8")
+
+    def verify(self, password, hashed):
+        """(matches, needs_rehash) for ``password`` against a stored hash"""
+        if hash_rounds(hashed) is None:
+            # Accounts created through Google sign-in have no password
+            return False, False
+        matches = self._run(bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+        return matches, matches and hash_rounds(hashed) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "busy_seconds": round(self._busy_seconds, 3),
+            }
+
+
+class AttemptLimiter:
+    """Failed-attempt counters per key over a sliding ``window``.
+
+    A key with ``limit`` failures inside the window is refused until the
+    oldest of them ages out. Counters live in this process only; at most
+    ``maxsize`` keys are tracked, least recently failed dropped first.
+    """
+
+    def __init__(self, limit, window=LOGIN_WINDOW_SECONDS, maxsize=100000):
+        self.limit = limit
+        self.window = window
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._failures = OrderedDict()
+        self._blocked = 0
+
+    def _recent(self, key, now):
+        failures = [t for t in self._failures.get(key, ()) if now - t < self.window]
+        if failures:
+            self._failures[key] = failures
+        else:
+            self._failures.pop(key, None)
+        return failures
+
+    def retry_after(self, key):
+        """Seconds until ``key`` may try again, or 0 if it is not throttled"""
+        now = time.monotonic()
+        with self._lock:
+            failures = self._recent(key, now)
+            if len(failures) < self.limit:
+                return 0
+            self._blocked += 1
+            return max(1, int(failures[-self.limit] + self.window - now) + 1)
+
+    def failure(self, key):
+        now = time.monotonic()
+        with self._lock:
+            failures = self._recent(key, now)
+            failures.append(now)
+            self._failures[key] = failures[-self.limit:]
+            self._failures.move_to_end(key)
+            while len(self._failures) > self.maxsize:
+                self._failures.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"tracked_keys": len(self._failures), "blocked": self._blocked}
+
+
+password_hasher = PasswordHasher()
+user_attempts = AttemptLimiter(LOGIN_MAX_FAILURES)
+ip_attempts = AttemptLimiter(LOGIN_IP_MAX_FAILURES)
@@ -0,0 +1,157 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of DB-API connections.
+
+    Connections are created lazily by ``connect`` up to ``max_size``. Idle
+    connections that have sat longer than ``health_check_interval`` seconds are
+    pinged on checkout and transparently replaced if the ping fails.
+    """
+
+    def __init__(self, connect, max_size=10, timeout=30, health_check_interval=30, health_check_sql="SELECT 1"):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_sql = health_check_sql
+
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, returned_at), used as a LIFO stack
+        self._size = 0
+        self._stats = {
+            "created": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "reconnects": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+        }
+
+    def _create(self):
+        conn = self._connect()
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_check_sql)
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def checkout(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._stats["checkouts"] += 1
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection available after {timeout}s")
+                self._stats["waits"] += 1
+                self._cond.wait(remaining)
+
+            if self._idle:
+                conn, returned_at = self._idle.pop()
+            else:
+                conn, returned_at = None, None
+                self._size += 1
+
+        if conn is None:
+            try:
+                return self._create()
+            except Exception:
+                self._release_slot()
+                raise
+
+        if time.monotonic() - returned_at >= self.health_check_interval and not self._is_healthy(conn):
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+                self._stats["reconnects"] += 1
+            self._close_quietly(conn)
+            try:
+                return self._create()
+            except Exception:
+                self._release_slot()
+                raise
+
+        return conn
+
+    def checkin(self, conn, discard=False):
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard:
+            self._close_quietly(conn)
+            with self._cond:
+                self._stats["discarded"] += 1
+            self._release_slot()
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            self.checkin(conn)
+
+    def ping(self, timeout=2):
+        """Run the health check on a pooled connection now; raises if the database is unreachable"""
+        conn = self.checkout(timeout)
+        if not self._is_healthy(conn):
+            self.checkin(conn, discard=True)
+            # The idle connection may just have gone stale; a fresh one tells us about the database
+            conn = self.checkout(timeout)
+            if not self._is_healthy(conn):
+                self.checkin(conn, discard=True)
+                raise ConnectionError("Database health check failed")
+        self.checkin(conn)
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                **self._stats,
+            }
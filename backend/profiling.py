@@ -0,0 +1,181 @@
+import cProfile
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from flask import current_app, g, request
+
+# Shared secret for the X-Profile header and the profile download routes; unset disables both
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN') or None
+# Fraction of all requests profiled without being asked to; 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+# Also trace allocations for sampled requests (header requests opt in with X-Profile-Memory: 1)
+PROFILE_MEMORY = os.environ.get('PROFILE_MEMORY', '0') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'finance-profiles'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 20))
+PROFILE_TOP = 25
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfiler:
+    """Opt-in cProfile (and tracemalloc) runs of individual requests.
+
+    A request is profiled when it carries ``X-Profile: <token>`` or falls
+    in the ``sample_rate`` sample. Only one request is profiled at a time
+    per process; others overlapping it run normally. Each run is kept in
+    ``profile_dir`` as ``<id>.prof`` (pstats), optionally ``<id>.tracemalloc``
+    (a tracemalloc snapshot) and ``<id>.json`` (request details and the
+    top functions); only the newest ``keep`` runs are kept. Requests to the
+    ``exclude`` endpoints, or to views marked ``skip_profiling`` (the
+    operator routes), are never profiled. With no token and a zero sample
+    rate no hooks are installed at all.
+    """
+
+    def __init__(self, token=PROFILE_TOKEN, sample_rate=PROFILE_SAMPLE_RATE, memory=PROFILE_MEMORY,
+                 profile_dir=PROFILE_DIR, keep=PROFILE_KEEP, exclude=("list_profiles", "download_profile")):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.memory = memory
+        self.profile_dir = profile_dir
+        self.keep = keep
+        self.exclude = set(exclude)
+        self._busy = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.token is not None or self.sample_rate > 0
+
+    def authorized(self, supplied):
+        return self.token is not None and supplied is not None and hmac.compare_digest(supplied, self.token)
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        app.before_request(self.start)
+        app.after_request(self.tag_response)
+        app.teardown_request(self.finish)
+
+    def start(self):
+        if request.endpoint in self.exclude or getattr(current_app.view_functions.get(request.endpoint), "skip_profiling", False):
+            return
+        requested = request.headers.get('X-Profile')
+        if requested is not None:
+            if not self.authorized(requested):
+                return
+            memory = request.headers.get('X-Profile-Memory') == '1'
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            memory = self.memory
+        else:
+            return
+        # cProfile and tracemalloc are process-wide; a request overlapping a profiled one is skipped
+        if not self._busy.acquire(blocking=False):
+            return
+
+        tracing = memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start(25)
+        profiler = cProfile.Profile()
+        g.profile = {
+            "id": datetime.utcnow().strftime("%Y%m%d%H%M%S%f") + "-" + uuid.uuid4().hex[:8],
+            "profiler": profiler,
+            "memory": memory,
+            "started_tracemalloc": tracing,
+            "started": time.perf_counter(),
+            "requested": requested is not None,
+        }
+        profiler.enable()
+
+    def tag_response(self, response):
+        profile = g.get('profile')
+        if profile is not None:
+            profile["status"] = response.status_code
+            response.headers['X-Profile-Id'] = profile["id"]
+        return response
+
+    def finish(self, exc=None):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        try:
+            profile["profiler"].disable()
+            duration = time.perf_counter() - profile["started"]
+            snapshot = tracemalloc.take_snapshot() if profile["memory"] and tracemalloc.is_tracing() else None
+            if profile["started_tracemalloc"]:
+                tracemalloc.stop()
+        finally:
+            self._busy.release()
+
+        try:
+            self._save(profile, duration, snapshot, exc)
+        except Exception as e:
+            logger.warning("Could not save profile %s: %s", profile["id"], e)
+
+    def _save(self, profile, duration, snapshot, exc):
+        base = os.path.join(self.profile_dir, profile["id"])
+        profile["profiler"].dump_stats(base + ".prof")
+
+        summary = io.StringIO()
+        pstats.Stats(profile["profiler"], stream=summary).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        details = {
+            "id": profile["id"],
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": profile.get("status", 500),
+            "error": repr(exc) if exc is not None else None,
+            "duration_ms": round(duration * 1000, 3),
+            "requested": profile["requested"],
+            "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "top_functions": summary.getvalue(),
+        }
+        if snapshot is not None:
+            snapshot.dump(base + ".tracemalloc")
+            details["top_allocations"] = [str(stat) for stat in snapshot.statistics("lineno")[:PROFILE_TOP]]
+        with open(base + ".json", "w") as f:
+            json.dump(details, f, indent=2)
+        logger.info("Profiled %s %s in %.1f ms as %s", request.method, request.path, duration * 1000, profile["id"])
+        self._prune()
+
+    def _prune(self):
+        ids = sorted(name[:-len(".json")] for name in os.listdir(self.profile_dir) if name.endswith(".json"))
+        for old in ids[:-self.keep or None]:
+            for suffix in (".json", ".prof", ".tracemalloc"):
+                try:
+                    os.remove(os.path.join(self.profile_dir, old + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list(self):
+        profiles = []
+        for name in sorted(os.listdir(self.profile_dir), reverse=True) if os.path.isdir(self.profile_dir) else []:
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.profile_dir, name)) as f:
+                        details = json.load(f)
+                except FileNotFoundError:
+                    continue  # pruned while listing
+                details.pop("top_functions", None)
+                details.pop("top_allocations", None)
+                profiles.append(details)
+        return profiles
+
+    def path(self, profile_id, kind):
+        """File for a stored profile: kind is 'json', 'prof' or 'tracemalloc'; None if there is no such file"""
+        if kind not in ("json", "prof", "tracemalloc") or not profile_id.replace("-", "").isalnum():
+            return None
+        path = os.path.join(self.profile_dir, f"{profile_id}.{kind}")
+        return path if os.path.exists(path) else None
+
+
+request_profiler = RequestProfiler()
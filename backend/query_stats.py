@@ -0,0 +1,260 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from flask import g, has_request_context, request
+from metrics import Histogram
+
+SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '1') == '1'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+# The same statement this many times in one request is reported as a likely N+1 pattern
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10))
+MAX_FINGERPRINTS = int(os.environ.get('SQL_MAX_FINGERPRINTS', 500))
+
+QUERY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Statement with literals replaced by ? and whitespace collapsed, so calls that differ only in values group together"""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (?...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+class StatementStats:
+    __slots__ = ("id", "sql", "calls", "errors", "rows", "max_seconds", "latency")
+
+    def __init__(self, sql):
+        self.id = hashlib.sha1(sql.encode("utf-8")).hexdigest()[:10]
+        self.sql = sql
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.max_seconds = 0.0
+        self.latency = Histogram(QUERY_BUCKETS)
+
+
+class QueryStats:
+    """Per-statement timing and row counts, aggregated by fingerprint.
+
+    Inside a request the statement is also counted on ``g`` so the request
+    metrics can record queries per request, and a statement repeated
+    ``n_plus_one`` times in one request is logged once as a likely N+1.
+    At most ``max_fingerprints`` distinct statements are tracked; the rest
+    are folded into one ``(other)`` entry.
+    """
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, n_plus_one=N_PLUS_ONE_THRESHOLD, max_fingerprints=MAX_FINGERPRINTS):
+        self.slow_seconds = slow_ms / 1000
+        self.n_plus_one = n_plus_one
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._slow = 0
+        self._n_plus_one = {}
+
+    def _entry(self, sql):
+        entry = self._statements.get(sql)
+        if entry is None:
+            if len(self._statements) >= self.max_fingerprints:
+                sql = "(other)"
+                entry = self._statements.get(sql)
+            if entry is None:
+                entry = self._statements[sql] = StatementStats(sql)
+        return entry
+
+    def record(self, sql, seconds, rows, failed=False):
+        with self._lock:
+            entry = self._entry(sql)
+            entry.calls += 1
+            entry.errors += failed
+            if rows > 0:
+                entry.rows += rows
+            entry.latency.observe(seconds)
+            if seconds > entry.max_seconds:
+                entry.max_seconds = seconds
+            if seconds >= self.slow_seconds:
+                self._slow += 1
+
+        endpoint = None
+        if has_request_context():
+            endpoint = request.endpoint or "unmatched"
+            g.sql_queries = g.get("sql_queries", 0) + 1
+            g.sql_seconds = g.get("sql_seconds", 0.0) + seconds
+            counts = g.get("sql_counts")
+            if counts is None:
+                counts = g.sql_counts = {}
+            counts[sql] = counts.get(sql, 0) + 1
+            if counts[sql] == self.n_plus_one:
+                with self._lock:
+                    self._n_plus_one[endpoint] = self._n_plus_one.get(endpoint, 0) + 1
+                logger.warning(
+                    "Possible N+1: %s ran the same statement %d times in one request: %s",
+                    endpoint, counts[sql], sql[:300]
+                )
+        if seconds >= self.slow_seconds:
+            # Rows a SELECT returns are only known once fetched; rowcount covers DML
+            logger.warning(
+                "Slow query (%.1f ms%s%s): %s",
+                seconds * 1000, f", {rows} rows affected" if rows >= 0 else "", f", {endpoint}" if endpoint else "", sql[:1000],
+                extra={"fields": {"duration_ms": round(seconds * 1000, 3), "endpoint": endpoint}}
+            )
+
+    def add_rows(self, sql, rows):
+        with self._lock:
+            self._entry(sql).rows += rows
+
+    def snapshot(self, limit=20, order="total_seconds"):
+        """Top ``limit`` statements by ``order`` (total_seconds, calls, max_ms, rows, errors)"""
+        with self._lock:
+            statements = [
+                {
+                    "id": entry.id,
+                    "statement": entry.sql,
+                    "calls": entry.calls,
+                    "errors": entry.errors,
+                    "rows": entry.rows,
+                    "total_seconds": round(entry.latency.sum, 6),
+                    "mean_ms": round(entry.latency.sum / entry.calls * 1000, 3) if entry.calls else None,
+                    "max_ms": round(entry.max_seconds * 1000, 3),
+                    "latency_ms_buckets": dict(zip([f"{b * 1000:g}" for b in QUERY_BUCKETS] + ["+Inf"], entry.latency.counts)),
+                }
+                for entry in self._statements.values()
+            ]
+            totals = {
+                "statements": len(statements),
+                "calls": sum(s["calls"] for s in statements),
+                "total_seconds": round(sum(s["total_seconds"] for s in statements), 6),
+                "slow_queries": self._slow,
+                "slow_query_ms": self.slow_seconds * 1000,
+                "n_plus_one_requests": dict(self._n_plus_one),
+            }
+        statements.sort(key=lambda s: s[order], reverse=True)
+        return {"totals": totals, "statements": statements[:limit]}
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._n_plus_one.clear()
+            self._slow = 0
+
+    def collect(self):
+        """Metric families for the request metrics' /metrics scrape"""
+        with self._lock:
+            calls = sum(entry.calls for entry in self._statements.values())
+            errors = sum(entry.errors for entry in self._statements.values())
+            seconds = sum(entry.latency.sum for entry in self._statements.values())
+            n_plus_one = dict(self._n_plus_one)
+            slow = self._slow
+        return [
+            ("db_queries_total", "counter", "SQL statements executed.", [({}, calls)]),
+            ("db_query_errors_total", "counter", "SQL statements that raised.", [({}, errors)]),
+            ("db_query_seconds_total", "counter", "Time spent executing SQL statements.", [({}, seconds)]),
+            ("db_slow_queries_total", "counter", "SQL statements slower than SLOW_QUERY_MS.", [({}, slow)]),
+            ("db_n_plus_one_requests_total", "counter", "Requests that repeated one statement N_PLUS_ONE_THRESHOLD times, by endpoint.",
+             [({"endpoint": endpoint}, count) for endpoint, count in sorted(n_plus_one.items())]),
+        ]
+
+
+query_stats = QueryStats()
+
+
+class InstrumentedCursor:
+    """DB-API cursor proxy timing every execute and counting the rows it returns or touches"""
+
+    __slots__ = ("_cursor", "_stats", "_last")
+
+    def __init__(self, cursor, stats):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_stats", stats)
+        object.__setattr__(self, "_last", None)
+
+    def _run(self, method, sql, args):
+        statement = fingerprint(sql)
+        object.__setattr__(self, "_last", statement)
+        started = time.perf_counter()
+        try:
+            result = method(sql, *args)
+        except Exception:
+            self._stats.record(statement, time.perf_counter() - started, 0, failed=True)
+            raise
+        # rowcount is the affected row count for DML and -1 (or 0) for SELECTs, whose rows are counted as fetched
+        self._stats.record(statement, time.perf_counter() - started, self._cursor.rowcount)
+        return result
+
+    def execute(self, sql, *args):
+        self._run(self._cursor.execute, sql, args)
+        return self
+
+    def executemany(self, sql, *args):
+        self._run(self._cursor.executemany, sql, args)
+        return self
+
+    def _fetched(self, rows):
+        if self._last is not None and rows:
+            self._stats.add_rows(self._last, rows)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._fetched(0 if row is None else 1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # e.g. pyodbc's fast_executemany
+        setattr(self._cursor, name, value)
+
+
+class InstrumentedConnection:
+    """DB-API connection proxy whose cursors are InstrumentedCursors"""
+
+    __slots__ = ("_conn", "_stats")
+
+    def __init__(self, conn, stats):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_stats", stats)
+
+    def cursor(self, *args):
+        return InstrumentedCursor(self._conn.cursor(*args), self._stats)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # e.g. pyodbc's autocommit, toggled by SQLServerStorage.transaction
+        setattr(self._conn, name, value)
+
+
+def instrumented(connect, stats=query_stats):
+    """Wrap a connection factory so every cursor it hands out is instrumented"""
+    def instrumented_connect():
+        return InstrumentedConnection(connect(), stats)
+
+    return instrumented_connect
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 2048))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 300))
+
+
+class ResponseCache:
+    """Bounded LRU of rendered GET responses, keyed by user and request.
+
+    Every entry remembers the user's data version it was built at, which
+    callers read from ``account_balances.version`` (see
+    ``rollups.data_version``). Writes bump that column in their own
+    transaction, so a write on any worker makes every worker's entries for
+    that user miss. Responses that also depend on the forecast model put
+    ``model_version`` in their key, so a model swap only retires those. The
+    TTL only bounds memory held by entries nobody asks for again.
+    """
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Version of the forecast model this process serves; set on every swap
+        self.model_version = None
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._expired = 0
+        self._evictions = 0
+
+    def etag(self, key, version):
+        """Strong validator for ``key`` at data ``version``; the same on every worker.
+
+        The digest covers the username too: data versions are small per-user
+        counters, so without it two users could share a tag for the same URL.
+        """
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+        return f"{version}-{digest}"
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            stored_version, stored_at, value = entry
+            if stored_version != version:
+                del self._entries[key]
+                self._stale += 1
+                self._misses += 1
+                return None
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self._expired += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "max_size": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else None,
+                "stale": self._stale,
+                "expired": self._expired,
+                "evictions": self._evictions,
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,219 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from globals import storage
+
+logger = logging.getLogger(__name__)
+
+EXPENSE = 'expense'
+INCOME = 'income'
+SAVING = 'saving'
+
+# Sources the rollup is derived from: kind -> (table, category column or None)
+SOURCES = {
+    EXPENSE: ("expenses", "category"),
+    INCOME: ("salaries", None),
+    SAVING: ("saving_goals", "category"),
+}
+
+# Running all-time totals kept in account_balances: kind -> column
+BALANCE_COLUMNS = {
+    INCOME: "total_income",
+    EXPENSE: "total_expenses",
+    SAVING: "total_savings",
+}
+
+# Full recomputation of every user's totals in one statement
+BALANCE_RECOMPUTE_SQL = """
+    SELECT username, SUM(income) AS income, SUM(expenses) AS expenses, SUM(savings) AS savings FROM (
+        SELECT username, amount AS income, 0 AS expenses, 0 AS savings FROM salaries
+        UNION ALL SELECT username, 0, amount, 0 FROM expenses
+        UNION ALL SELECT username, 0, 0, amount FROM saving_goals
+    ) totals
+    WHERE username IS NOT NULL
+    GROUP BY username
+"""
+
+# Largest difference between a stored and a recomputed total that is not drift
+DRIFT_TOLERANCE = 0.005
+
+
+def month_of(date):
+    if isinstance(date, datetime):
+        return date.strftime('%Y-%m')
+    return str(date)[:7]
+
+
+def record(cursor, username, kind, category, date, amount, count=1):
+    """Add ``amount``/``count`` to one (username, month, kind, category) bucket.
+
+    Call with negative values to take a row back out; run it in the same
+    transaction as the write it mirrors.
+    """
+    key = (username, month_of(date), kind, category or '')
+    update = (
+        "UPDATE monthly_rollups SET total = total + ?, entries = entries + ? "
+        "WHERE username = ? AND month = ? AND kind = ? AND category = ?"
+    )
+    cursor.execute(update, (amount, count, *key))
+    if cursor.rowcount == 0:
+        try:
+            cursor.execute(
+                "INSERT INTO monthly_rollups (username, month, kind, category, total, entries) VALUES (?, ?, ?, ?, ?, ?)",
+                (*key, amount, count)
+            )
+        except storage.IntegrityError:
+            # Another request created the bucket first
+            cursor.execute(update, (amount, count, *key))
+    elif count < 0:
+        cursor.execute(
+            "DELETE FROM monthly_rollups WHERE username = ? AND month = ? AND kind = ? AND category = ? AND entries <= 0",
+            key
+        )
+    adjust_balance(cursor, username, kind, amount)
+    # The stored forecast was made from the old totals
+    cursor.execute("DELETE FROM predictions WHERE username = ?", (username,))
+
+
+def adjust_balance(cursor, username, kind, amount):
+    """Move the user's running total for ``kind`` by ``amount`` and bump their data version"""
+    _update_balance(cursor, username, BALANCE_COLUMNS[kind], amount)
+
+
+def bump_version(cursor, username):
+    """Bump the user's data version for a write that moves no total (e.g. a budget); run it in that write's transaction"""
+    _update_balance(cursor, username)
+
+
+def _update_balance(cursor, username, column=None, amount=0):
+    # account_balances.version changes with every write to the user's data, so it is the
+    # one value every worker can build ETags and cache checks from
+    if column:
+        update, params = f"UPDATE account_balances SET {column} = {column} + ?, version = version + 1 WHERE username = ?", (amount, username)
+        insert, insert_params = f"INSERT INTO account_balances (username, {column}, version) VALUES (?, ?, 1)", (username, amount)
+    else:
+        update, params = "UPDATE account_balances SET version = version + 1 WHERE username = ?", (username,)
+        insert, insert_params = "INSERT INTO account_balances (username, version) VALUES (?, 1)", (username,)
+    cursor.execute(update, params)
+    if cursor.rowcount == 0:
+        try:
+            cursor.execute(insert, insert_params)
+        except storage.IntegrityError:
+            cursor.execute(update, params)
+
+
+def data_version(cursor, username):
+    """The user's data version; 0 until their first write"""
+    cursor.execute("SELECT version FROM account_balances WHERE username = ?", (username,))
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+
+def unrecord(cursor, username, kind, category, date, amount, count=1):
+    record(cursor, username, kind, category, date, -amount, -count)
+
+
+def record_frame(cursor, username, kind, df, category_column=None):
+    """Fold a bulk-imported DataFrame (with date and amount columns) into the rollup"""
+    buckets = df.assign(
+        month=df["date"].str[:7],
+        bucket=df[category_column] if category_column else '',
+    ).groupby(["month", "bucket"])["amount"].agg(["sum", "count"])
+    for (month, category), totals in buckets.iterrows():
+        record(cursor, username, kind, category, month, float(totals["sum"]), int(totals["count"]))
+
+
+def rebuild(conn):
+    """Regenerate monthly_rollups and account_balances from expenses, salaries and saving_goals"""
+    month = storage.month_expr("date")
+    with storage.transaction(conn) as cursor:
+        cursor.execute("DELETE FROM monthly_rollups")
+        for kind, (table, category_column) in SOURCES.items():
+            category = category_column or "''"
+            cursor.execute(f"""
+                INSERT INTO monthly_rollups (username, month, kind, category, total, entries)
+                SELECT username, {month}, ?, COALESCE({category}, ''), SUM(amount), COUNT(*)
+                FROM {table}
+                GROUP BY username, {month}, COALESCE({category}, '')
+            """, (kind,))
+        # Every user's version moves past the highest one handed out so far, so no earlier ETag can match
+        cursor.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM account_balances")
+        version = cursor.fetchone()[0]
+        cursor.execute("UPDATE account_balances SET total_income = 0, total_expenses = 0, total_savings = 0, version = ?", (version,))
+        cursor.execute(f"DELETE FROM account_balances WHERE username IN (SELECT username FROM ({BALANCE_RECOMPUTE_SQL}) t)")
+        cursor.execute(
+            "INSERT INTO account_balances (username, total_income, total_expenses, total_savings, version) "
+            f"SELECT username, income, expenses, savings, ? FROM ({BALANCE_RECOMPUTE_SQL}) t",
+            (version,)
+        )
+        cursor.execute("SELECT COUNT(*) FROM monthly_rollups")
+        return cursor.fetchone()[0]
+
+
+def check_balances(conn, repair=False):
+    """Compare account_balances with a full recomputation from the base tables.
+
+    Returns the mismatching users as (username, stored, actual) with each
+    side an (income, expenses, savings) tuple; ``repair`` overwrites the
+    stored totals with the recomputed ones in the same transaction, so a
+    write landing meanwhile is never replaced by an older reading.
+    """
+    with storage.transaction(conn) as cursor:
+        # Users with a balance row but no base rows anymore are checked too (against zero)
+        cursor.execute(f"""
+            SELECT b.username, b.total_income, b.total_expenses, b.total_savings, t.income, t.expenses, t.savings
+            FROM account_balances b
+            LEFT JOIN ({BALANCE_RECOMPUTE_SQL}) t ON t.username = b.username
+            UNION ALL
+            SELECT t.username, NULL, NULL, NULL, t.income, t.expenses, t.savings
+            FROM ({BALANCE_RECOMPUTE_SQL}) t
+            WHERE t.username NOT IN (SELECT username FROM account_balances)
+        """)
+        mismatches = []
+        for username, *values in cursor.fetchall():
+            stored = tuple(float(v or 0) for v in values[:3])
+            actual = tuple(float(v or 0) for v in values[3:])
+            if any(abs(a - b) > DRIFT_TOLERANCE for a, b in zip(stored, actual)):
+                mismatches.append((username, stored, actual))
+
+        if repair and mismatches:
+            drifted = " OR ".join(
+                f"ABS(account_balances.{column} - t.{total}) > ?"
+                for column, total in (("total_income", "income"), ("total_expenses", "expenses"), ("total_savings", "savings"))
+            )
+            cursor.execute(f"""
+                UPDATE account_balances
+                SET total_income = t.income, total_expenses = t.expenses, total_savings = t.savings, version = version + 1
+                FROM ({BALANCE_RECOMPUTE_SQL}) t
+                WHERE t.username = account_balances.username AND ({drifted})
+            """, (DRIFT_TOLERANCE,) * 3)
+            cursor.execute(f"""
+                UPDATE account_balances
+                SET total_income = 0, total_expenses = 0, total_savings = 0, version = version + 1
+                WHERE (ABS(total_income) > ? OR ABS(total_expenses) > ? OR ABS(total_savings) > ?)
+                AND username NOT IN (SELECT username FROM ({BALANCE_RECOMPUTE_SQL}) t)
+            """, (DRIFT_TOLERANCE,) * 3)
+            cursor.execute(f"""
+                INSERT INTO account_balances (username, total_income, total_expenses, total_savings, version)
+                SELECT username, income, expenses, savings, 1 FROM ({BALANCE_RECOMPUTE_SQL}) t
+                WHERE username NOT IN (SELECT username FROM account_balances)
+            """)
+    return mismatches
+
+
+def start_balance_checker(pool, interval=3600, repair=True):
+    """Daemon thread running check_balances every ``interval`` seconds"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with pool.connection() as conn:
+                    for username, stored, actual in check_balances(conn, repair=repair):
+                        logger.warning("Balance drift for %s: stored %s, recomputed %s", username, stored, actual)
+            except Exception as e:
+                logger.exception("Balance consistency check failed: %s", e)
+
+    thread = threading.Thread(target=run, name="balance-checker", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,428 @@
+import base64
+import csv
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+CSV_DIR = os.path.join(os.path.dirname(__file__), "Database")
+
+
+class Storage:
+    """Engine-specific pieces of the data-access layer.
+
+    Blueprints keep writing plain parameterised SQL with ``?`` placeholders;
+    anything that differs between engines (paging, month bucketing, DDL,
+    query plans) goes through the active storage object.
+    """
+
+    name = None
+    embedded = False
+    health_check_sql = "SELECT 1"
+    schema = []
+    # Columns added after their table first shipped, as (table, column, definition); bootstrap adds any that are missing
+    added_columns = [
+        ("account_balances", "version", "BIGINT NOT NULL DEFAULT 0"),
+    ]
+
+    def connect(self):
+        raise NotImplementedError
+
+    @property
+    def IntegrityError(self):
+        raise NotImplementedError
+
+    def paginate(self, sql, params, offset, limit):
+        """Append an engine-specific page clause to an ORDER BY query"""
+        raise NotImplementedError
+
+    def month_expr(self, column):
+        """SQL expression formatting a datetime column as YYYY-MM"""
+        raise NotImplementedError
+
+    def explain(self, conn, sql, params=()):
+        raise NotImplementedError
+
+    def add_column(self, cursor, table, column, definition):
+        """ALTER TABLE ... ADD unless the column is already there"""
+        raise NotImplementedError
+
+    @contextmanager
+    def transaction(self, conn):
+        """Cursor whose statements commit or roll back together"""
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def executemany(self, cursor, sql, rows, batch_size=1000):
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+
+    def bootstrap(self, conn, seed=False):
+        cursor = conn.cursor()
+        for statement in self.schema:
+            cursor.execute(statement)
+        for table, column, definition in self.added_columns:
+            self.add_column(cursor, table, column, definition)
+        conn.commit()
+        if seed:
+            self.seed(conn)
+
+    def seed(self, conn, csv_dir=CSV_DIR):
+        """Load backend/Database/*.csv into empty tables.
+
+        The CSVs predate per-user rows, so expenses, salaries and saving goals
+        are spread round-robin across the seeded logins.
+        """
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT COUNT(*) FROM logins")
+        if cursor.fetchone()[0] == 0:
+            rows = [
+                (row["id"], row["name"], row["username"], base64.b64decode(row["password"]).decode("utf-8"), row["email"])
+                for row in _read_csv(csv_dir, "logins.csv")
+            ]
+            cursor.executemany("INSERT INTO logins (id, name, username, password, email) VALUES (?, ?, ?, ?, ?)", rows)
+
+        cursor.execute("SELECT username FROM logins ORDER BY username")
+        usernames = [row[0] for row in cursor.fetchall()]
+        if not usernames:
+            conn.commit()
+            return
+
+        def owner(i):
+            return usernames[i % len(usernames)]
+
+        cursor.execute("SELECT COUNT(*) FROM expenses")
+        if cursor.fetchone()[0] == 0:
+            rows = [
+                (row["id"], row["description"], float(row["amount"]), row["category"], row["date"], owner(i))
+                for i, row in enumerate(_read_csv(csv_dir, "expenses.csv"))
+            ]
+            cursor.executemany("INSERT INTO expenses (id, description, amount, category, date, username) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        cursor.execute("SELECT COUNT(*) FROM salaries")
+        if cursor.fetchone()[0] == 0:
+            rows = [
+                (row["id"], row["name"], float(row["amount"]), row["date"], owner(i))
+                for i, row in enumerate(_read_csv(csv_dir, "salaries.csv"))
+            ]
+            cursor.executemany("INSERT INTO salaries (id, name, amount, date, username) VALUES (?, ?, ?, ?, ?)", rows)
+
+        cursor.execute("SELECT COUNT(*) FROM saving_goals")
+        if cursor.fetchone()[0] == 0:
+            rows = [
+                (row["id"], row["description"], float(row["amount"]), row["category"], row["status"], row["date"], owner(i))
+                for i, row in enumerate(_read_csv(csv_dir, "saving_goals.csv"))
+            ]
+            cursor.executemany("INSERT INTO saving_goals (id, description, amount, category, status, date, username) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+        conn.commit()
+
+
+def _read_csv(csv_dir, filename):
+    with open(os.path.join(csv_dir, filename), newline="") as f:
+        return list(csv.DictReader(f))
+
+
+class SQLServerStorage(Storage):
+    name = "sqlserver"
+
+    schema = [
+        """IF OBJECT_ID('logins', 'U') IS NULL CREATE TABLE logins (
+            id VARCHAR(36) PRIMARY KEY,
+            name VARCHAR(100),
+            username VARCHAR(100) NOT NULL UNIQUE,
+            password VARCHAR(255) NOT NULL,
+            email VARCHAR(255) NOT NULL UNIQUE
+        )""",
+        """IF OBJECT_ID('expenses', 'U') IS NULL CREATE TABLE expenses (
+            id VARCHAR(36) PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            amount DECIMAL(12,2) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            username VARCHAR(100) NOT NULL
+        )""",
+        """IF OBJECT_ID('salaries', 'U') IS NULL CREATE TABLE salaries (
+            id VARCHAR(36) PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            amount DECIMAL(12,2) NOT NULL,
+            date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            username VARCHAR(100) NOT NULL
+        )""",
+        """IF OBJECT_ID('saving_goals', 'U') IS NULL CREATE TABLE saving_goals (
+            id VARCHAR(36) PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            amount DECIMAL(12,2) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            status VARCHAR(50) NOT NULL CHECK (status IN ('completed', 'ongoing', 'save')),
+            date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            username VARCHAR(100) NOT NULL
+        )""",
+        """IF OBJECT_ID('budgets', 'U') IS NULL CREATE TABLE budgets (
+            id VARCHAR(36) PRIMARY KEY,
+            username VARCHAR(100) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            monthly_limit DECIMAL(12,2) NOT NULL,
+            used_amount DECIMAL(12,2) NOT NULL DEFAULT 0,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """IF OBJECT_ID('monthly_rollups', 'U') IS NULL CREATE TABLE monthly_rollups (
+            username VARCHAR(100) NOT NULL,
+            month CHAR(7) NOT NULL,
+            kind VARCHAR(10) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            total DECIMAL(14,2) NOT NULL DEFAULT 0,
+            entries INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, month, kind, category)
+        )""",
+        """IF OBJECT_ID('account_balances', 'U') IS NULL CREATE TABLE account_balances (
+            username VARCHAR(100) PRIMARY KEY,
+            total_income DECIMAL(14,2) NOT NULL DEFAULT 0,
+            total_expenses DECIMAL(14,2) NOT NULL DEFAULT 0,
+            total_savings DECIMAL(14,2) NOT NULL DEFAULT 0,
+            version BIGINT NOT NULL DEFAULT 0
+        )""",
+        """IF OBJECT_ID('predictions', 'U') IS NULL CREATE TABLE predictions (
+            username VARCHAR(100) PRIMARY KEY,
+            prediction DECIMAL(14,2) NOT NULL,
+            total_income DECIMAL(14,2) NOT NULL,
+            total_expense DECIMAL(14,2) NOT NULL,
+            total_savings DECIMAL(14,2) NOT NULL,
+            model_version VARCHAR(32) NOT NULL,
+            predicted_at DATETIME NOT NULL
+        )""",
+        """IF OBJECT_ID('revoked_tokens', 'U') IS NULL CREATE TABLE revoked_tokens (
+            jti CHAR(32) PRIMARY KEY,
+            expires_at DATETIME NOT NULL
+        )""",
+        """IF OBJECT_ID('email_outbox', 'U') IS NULL CREATE TABLE email_outbox (
+            id VARCHAR(36) PRIMARY KEY,
+            recipient VARCHAR(255) NOT NULL,
+            subject VARCHAR(255) NOT NULL,
+            body NVARCHAR(MAX) NOT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            next_attempt_at DATETIME NOT NULL,
+            sent_at DATETIME NULL,
+            last_error VARCHAR(500) NULL,
+            created_at DATETIME NOT NULL
+        )""",
+        """IF OBJECT_ID('password_resets', 'U') IS NULL CREATE TABLE password_resets (
+            email VARCHAR(255) NOT NULL,
+            token VARCHAR(255) NOT NULL,
+            expires_at DATETIME NOT NULL,
+            created_at DATETIME NOT NULL
+        )""",
+        "IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_expenses_username_date') CREATE INDEX ix_expenses_username_date ON expenses (username, date, id)",
+        "IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_salaries_username_date') CREATE INDEX ix_salaries_username_date ON salaries (username, date, id)",
+        "IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_saving_goals_username_date') CREATE INDEX ix_saving_goals_username_date ON saving_goals (username, date, id)",
+        "IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_budgets_username_category') CREATE INDEX ix_budgets_username_category ON budgets (username, category)",
+        "IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_revoked_tokens_expires_at') CREATE INDEX ix_revoked_tokens_expires_at ON revoked_tokens (expires_at)",
+        "IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_password_resets_token') CREATE INDEX ix_password_resets_token ON password_resets (token)",
+        "IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_email_outbox_due') CREATE INDEX ix_email_outbox_due ON email_outbox (sent_at, next_attempt_at)",
+    ]
+
+    def __init__(self, conn_str):
+        self.conn_str = conn_str
+
+    def connect(self):
+        import pyodbc
+        return pyodbc.connect(self.conn_str, autocommit=True)
+
+    @property
+    def IntegrityError(self):
+        import pyodbc
+        return pyodbc.IntegrityError
+
+    @contextmanager
+    def transaction(self, conn):
+        # Pooled connections run in autocommit mode; switch it off for the block
+        conn.autocommit = False
+        try:
+            with super().transaction(conn) as cursor:
+                yield cursor
+        finally:
+            conn.autocommit = True
+
+    def executemany(self, cursor, sql, rows, batch_size=1000):
+        cursor.fast_executemany = True
+        super().executemany(cursor, sql, rows, batch_size)
+
+    def paginate(self, sql, params, offset, limit):
+        return f"{sql} OFFSET ? ROWS FETCH NEXT ? ROWS ONLY", (*params, offset, limit)
+
+    def month_expr(self, column):
+        return f"CONCAT(YEAR({column}), '-', RIGHT('0' + CAST(MONTH({column}) AS VARCHAR), 2))"
+
+    def add_column(self, cursor, table, column, definition):
+        cursor.execute(f"IF COL_LENGTH('{table}', '{column}') IS NULL ALTER TABLE {table} ADD {column} {definition}")
+
+    def explain(self, conn, sql, params=()):
+        cursor = conn.cursor()
+        cursor.execute("SET SHOWPLAN_TEXT ON")
+        try:
+            cursor.execute(sql, params)
+            plan = []
+            while True:
+                plan.extend(row[0] for row in cursor.fetchall())
+                if not cursor.nextset():
+                    break
+        finally:
+            cursor.execute("SET SHOWPLAN_TEXT OFF")
+        return plan
+
+
+def _adapt_datetime(value):
+    return value.isoformat(" ")
+
+
+def _convert_datetime(value):
+    return datetime.fromisoformat(value.decode("utf-8"))
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_converter("DATETIME", _convert_datetime)
+
+
+class SQLiteStorage(Storage):
+    name = "sqlite"
+    embedded = True
+
+    schema = [
+        """CREATE TABLE IF NOT EXISTS logins (
+            id VARCHAR(36) PRIMARY KEY,
+            name VARCHAR(100),
+            username VARCHAR(100) NOT NULL UNIQUE,
+            password VARCHAR(255) NOT NULL,
+            email VARCHAR(255) NOT NULL UNIQUE
+        )""",
+        """CREATE TABLE IF NOT EXISTS expenses (
+            id VARCHAR(36) PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            amount DECIMAL(12,2) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            username VARCHAR(100) NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS salaries (
+            id VARCHAR(36) PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            amount DECIMAL(12,2) NOT NULL,
+            date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            username VARCHAR(100) NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS saving_goals (
+            id VARCHAR(36) PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            amount DECIMAL(12,2) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            status VARCHAR(50) NOT NULL CHECK (status IN ('completed', 'ongoing', 'save')),
+            date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            username VARCHAR(100) NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS budgets (
+            id VARCHAR(36) PRIMARY KEY,
+            username VARCHAR(100) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            monthly_limit DECIMAL(12,2) NOT NULL,
+            used_amount DECIMAL(12,2) NOT NULL DEFAULT 0,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS monthly_rollups (
+            username VARCHAR(100) NOT NULL,
+            month CHAR(7) NOT NULL,
+            kind VARCHAR(10) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            total DECIMAL(14,2) NOT NULL DEFAULT 0,
+            entries INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, month, kind, category)
+        )""",
+        """CREATE TABLE IF NOT EXISTS account_balances (
+            username VARCHAR(100) PRIMARY KEY,
+            total_income DECIMAL(14,2) NOT NULL DEFAULT 0,
+            total_expenses DECIMAL(14,2) NOT NULL DEFAULT 0,
+            total_savings DECIMAL(14,2) NOT NULL DEFAULT 0,
+            version BIGINT NOT NULL DEFAULT 0
+        )""",
+        """CREATE TABLE IF NOT EXISTS predictions (
+            username VARCHAR(100) PRIMARY KEY,
+            prediction DECIMAL(14,2) NOT NULL,
+            total_income DECIMAL(14,2) NOT NULL,
+            total_expense DECIMAL(14,2) NOT NULL,
+            total_savings DECIMAL(14,2) NOT NULL,
+            model_version VARCHAR(32) NOT NULL,
+            predicted_at DATETIME NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS revoked_tokens (
+            jti CHAR(32) PRIMARY KEY,
+            expires_at DATETIME NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS email_outbox (
+            id VARCHAR(36) PRIMARY KEY,
+            recipient VARCHAR(255) NOT NULL,
+            subject VARCHAR(255) NOT NULL,
+            body TEXT NOT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            next_attempt_at DATETIME NOT NULL,
+            sent_at DATETIME NULL,
+            last_error VARCHAR(500) NULL,
+            created_at DATETIME NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS password_resets (
+            email VARCHAR(255) NOT NULL,
+            token VARCHAR(255) NOT NULL,
+            expires_at DATETIME NOT NULL,
+            created_at DATETIME NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_expenses_username_date ON expenses (username, date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_salaries_username_date ON salaries (username, date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_saving_goals_username_date ON saving_goals (username, date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_budgets_username_category ON budgets (username, category)",
+        "CREATE INDEX IF NOT EXISTS ix_revoked_tokens_expires_at ON revoked_tokens (expires_at)",
+        "CREATE INDEX IF NOT EXISTS ix_password_resets_token ON password_resets (token)",
+        "CREATE INDEX IF NOT EXISTS ix_email_outbox_due ON email_outbox (sent_at, next_attempt_at)",
+    ]
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @property
+    def IntegrityError(self):
+        return sqlite3.IntegrityError
+
+    def paginate(self, sql, params, offset, limit):
+        return f"{sql} LIMIT ? OFFSET ?", (*params, limit, offset)
+
+    def month_expr(self, column):
+        return f"strftime('%Y-%m', {column})"
+
+    def explain(self, conn, sql, params=()):
+        cursor = conn.cursor()
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+    def add_column(self, cursor, table, column, definition):
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def create_storage(backend, conn_str=None, sqlite_path=None):
+    if backend == "sqlserver":
+        return SQLServerStorage(conn_str)
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path)
+    raise ValueError(f"Unknown DB_BACKEND '{backend}'. Expected 'sqlserver' or 'sqlite'")
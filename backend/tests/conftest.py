@@ -0,0 +1,75 @@
+import base64
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# The app reads its configuration from the environment at import time
+TEST_DIR = tempfile.mkdtemp(prefix="finance-tests-")
+os.environ.update({
+    "DB_BACKEND": "sqlite",
+    "SQLITE_PATH": os.path.join(TEST_DIR, "finance.db"),
+    "BCRYPT_ROUNDS": "4",
+    "REFRESH_TOKEN_DAYS": "1",
+    "BALANCE_CHECK_SECONDS": "0",
+    "OUTBOX_SENDER": "0",
+    "LOG_SAMPLE_RATE": "0",
+    "OPERATOR_TOKEN": "operator-secret",
+    "PROFILE_TOKEN": "profile-secret",
+    "PROFILE_DIR": os.path.join(TEST_DIR, "profiles"),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+OPERATOR_HEADERS = {"X-Operator-Token": "operator-secret"}
+PROFILE_HEADERS = {"X-Profile": "profile-secret"}
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import app
+    app.config["TESTING"] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def conn(app):
+    from globals import pool
+    with pool.connection() as conn:
+        yield conn
+
+
+def basic_auth(username, password):
+    return {"Authorization": "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()}
+
+
+def register_user(client):
+    """A freshly registered, signed-in user: (username, login response body, access token headers)"""
+    username = "user" + uuid.uuid4().hex[:10]
+    response = client.post("/api/v1.0/register", data={
+        "name": "Test User", "email": f"{username}@example.com", "username": username, "password": "secret123",
+    })
+    assert response.status_code == 201
+    response = client.post("/api/v1.0/login", headers=basic_auth(username, "secret123"))
+    assert response.status_code == 200
+    tokens = response.get_json()
+    return username, tokens, {"x-access-token": tokens["token"]}
+
+
+@pytest.fixture
+def user(client):
+    return register_user(client)
+
+
+def add_expense(client, headers, amount, category="Dining", description="Dinner"):
+    response = client.post("/api/v1.0/expenses", headers=headers, data={
+        "description": description, "amount": str(amount), "category": category,
+    })
+    assert response.status_code == 201
+    return response.get_json()["id"]
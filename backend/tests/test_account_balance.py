@@ -0,0 +1,47 @@
+import rollups
+from globals import storage
+from conftest import add_expense
+
+
+def test_balance_follows_writes(client, conn, user):
+    username, tokens, headers = user
+    client.post("/api/v1.0/salaries", headers=headers, data={"name": "Salary", "amount": "1000"})
+    first = add_expense(client, headers, 12)
+    add_expense(client, headers, 30)
+    client.delete(f"/api/v1.0/expenses/{first}", headers=headers)
+
+    balance = client.get("/api/v1.0/account_balance", headers=headers).get_json()
+    assert balance["total_income"] == 1000.0
+    assert balance["total_expenses"] == 30.0
+    assert [m for m in rollups.check_balances(conn) if m[0] == username] == []
+
+
+def test_rebuild_keeps_balances_and_moves_versions_forward(client, conn, user):
+    username, tokens, headers = user
+    add_expense(client, headers, 11)
+    before = client.get("/api/v1.0/account_balance", headers=headers).get_json()
+    version = rollups.data_version(conn.cursor(), username)
+
+    rollups.rebuild(conn)
+
+    assert client.get("/api/v1.0/account_balance", headers=headers).get_json() == before
+    assert rollups.data_version(conn.cursor(), username) > version
+    assert rollups.check_balances(conn) == []
+
+
+def test_repair_fixes_drift_and_orphaned_balances(client, conn, user):
+    username, tokens, headers = user
+    add_expense(client, headers, 25)
+    with storage.transaction(conn) as cursor:
+        cursor.execute("UPDATE account_balances SET total_expenses = 99 WHERE username = ?", (username,))
+        cursor.execute("INSERT INTO account_balances (username, total_expenses, version) VALUES ('ghost', 40, 3)")
+    version = rollups.data_version(conn.cursor(), username)
+
+    drift = {m[0]: m for m in rollups.check_balances(conn, repair=True)}
+    assert drift[username][1:] == ((0.0, 99.0, 0.0), (0.0, 25.0, 0.0))
+    assert drift["ghost"][1:] == ((0.0, 40.0, 0.0), (0.0, 0.0, 0.0))
+
+    assert rollups.check_balances(conn) == []
+    assert client.get("/api/v1.0/account_balance", headers=headers).get_json()["total_expenses"] == 25.0
+    assert rollups.data_version(conn.cursor(), username) == version + 1
+    assert rollups.data_version(conn.cursor(), "ghost") == 4
@@ -0,0 +1,43 @@
+def test_logout_revokes_access_token(client, user):
+    username, tokens, headers = user
+    assert client.get("/api/v1.0/expenses", headers=headers).status_code == 200
+
+    response = client.post("/api/v1.0/logout", headers=dict(headers, **{"x-refresh-token": tokens["refresh_token"]}))
+    assert response.status_code == 200
+
+    response = client.get("/api/v1.0/expenses", headers=headers)
+    assert response.status_code == 403
+    assert response.get_json()["error"] == "Token is blacklisted"
+    response = client.post("/api/v1.0/refresh", headers={"x-refresh-token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+
+def test_refresh_token_is_rotated(client, user):
+    username, tokens, headers = user
+    response = client.post("/api/v1.0/refresh", headers={"x-refresh-token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    rotated = response.get_json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    assert client.get("/api/v1.0/expenses", headers={"x-access-token": rotated["token"]}).status_code == 200
+
+    # A refresh token can be exchanged only once
+    response = client.post("/api/v1.0/refresh", headers={"x-refresh-token": tokens["refresh_token"]})
+    assert response.status_code == 401
+    assert client.post("/api/v1.0/refresh", headers={"x-refresh-token": rotated["refresh_token"]}).status_code == 200
+
+
+def test_access_token_is_not_a_refresh_token(client, user):
+    username, tokens, headers = user
+    response = client.post("/api/v1.0/refresh", headers={"x-refresh-token": tokens["token"]})
+    assert response.status_code == 401
+
+
+
+def test_refresh_token_used_concurrently_is_exchanged_once(client, user, monkeypatch):
+    username, tokens, headers = user
+    # Both requests get past is_revoked before either has recorded the token
+    monkeypatch.setattr("blueprints.auth.auth.is_revoked", lambda claims, token: False)
+    first = client.post("/api/v1.0/refresh", headers={"x-refresh-token": tokens["refresh_token"]})
+    second = client.post("/api/v1.0/refresh", headers={"x-refresh-token": tokens["refresh_token"]})
+    assert first.status_code == 200
+    assert second.status_code == 401
@@ -0,0 +1,72 @@
+from blueprints.budget.budget import reconcile_budgets
+from conftest import add_expense
+from query_stats import query_stats
+
+
+def used_amount(conn, username, category):
+    cursor = conn.cursor()
+    cursor.execute("SELECT used_amount FROM budgets WHERE username = ? AND category = ?", (username, category))
+    return float(cursor.fetchone()[0])
+
+
+def test_used_amount_follows_expense_writes(client, conn, user):
+    username, tokens, headers = user
+    assert client.post("/api/v1.0/budgets", headers=headers, json={"category": "Dining", "monthly_limit": 100}).status_code == 201
+
+    first = add_expense(client, headers, 12)
+    second = add_expense(client, headers, 30)
+    response = client.put(f"/api/v1.0/expenses/{first}", headers=headers, data={
+        "description": "Dinner", "amount": "20", "category": "Dining",
+    })
+    assert response.status_code == 200
+    assert client.delete(f"/api/v1.0/expenses/{second}", headers=headers).status_code == 204
+    moved = add_expense(client, headers, 5, category="Transport", description="Bus Fare")
+    response = client.put(f"/api/v1.0/expenses/{moved}", headers=headers, data={
+        "description": "Dinner", "amount": "7", "category": "Dining",
+    })
+    assert response.status_code == 200
+    response = client.post("/api/v1.0/expenses/bulk", headers=headers, json=[
+        {"description": "Dinner", "amount": 3, "category": "Dining"},
+        {"description": "Movie", "amount": 9, "category": "Entertainment"},
+    ])
+    assert response.status_code == 201
+
+    assert used_amount(conn, username, "Dining") == 30.0
+    reconcile_budgets(conn)
+    assert used_amount(conn, username, "Dining") == 30.0
+
+
+def test_reconcile_ignores_expenses_before_the_budget(client, conn, user):
+    username, tokens, headers = user
+    add_expense(client, headers, 50)
+    # Backdate the existing expense so it clearly predates the budget
+    cursor = conn.cursor()
+    cursor.execute("UPDATE expenses SET date = '2020-01-01 00:00:00' WHERE username = ?", (username,))
+    conn.commit()
+
+    assert client.post("/api/v1.0/budgets", headers=headers, json={"category": "Dining", "monthly_limit": 100}).status_code == 201
+    add_expense(client, headers, 8)
+    assert used_amount(conn, username, "Dining") == 8.0
+
+    reconcile_budgets(conn)
+    assert used_amount(conn, username, "Dining") == 8.0
+
+
+def test_bulk_import_updates_each_budget_once(client, conn, user):
+    username, tokens, headers = user
+    client.post("/api/v1.0/budgets", headers=headers, json={"category": "Dining", "monthly_limit": 100})
+    client.post("/api/v1.0/budgets", headers=headers, json={"category": "Transport", "monthly_limit": 100})
+    rows = [{"description": "Dinner", "amount": 1, "category": "Dining", "date": f"2099-01-01 00:00:{i:02d}"} for i in range(40)]
+    rows += [{"description": "Bus Fare", "amount": 2, "category": "Transport", "date": f"2099-01-02 00:00:{i:02d}"} for i in range(10)]
+    # Dated before the budgets existed, so not counted against them
+    rows += [{"description": "Dinner", "amount": 100, "category": "Dining", "date": "2020-01-01 00:00:00"}]
+
+    query_stats.reset()
+    assert client.post("/api/v1.0/expenses/bulk", headers=headers, json=rows).status_code == 201
+    updates = [s for s in query_stats.snapshot(limit=1000)["statements"] if s["statement"].startswith("UPDATE budgets")]
+
+    assert sum(s["calls"] for s in updates) == 2
+    assert used_amount(conn, username, "Dining") == 40.0
+    assert used_amount(conn, username, "Transport") == 20.0
+    reconcile_budgets(conn)
+    assert used_amount(conn, username, "Dining") == 40.0
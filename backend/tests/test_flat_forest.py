@@ -0,0 +1,29 @@
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from blueprints.ML.flat_forest import FlatForest
+from blueprints.ML.model_registry import tree_roots
+
+
+def fitted_forest():
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 5000, size=(300, 3))
+    y = X[:, 0] - X[:, 1] + rng.normal(0, 50, size=300)
+    return RandomForestRegressor(n_estimators=15, random_state=0).fit(X, y), rng.uniform(0, 5000, size=(100, 3))
+
+
+def test_predictions_match_sklearn():
+    model, X = fitted_forest()
+    np.testing.assert_allclose(FlatForest.from_estimator(model).predict(X), model.predict(X), rtol=1e-9)
+
+
+def test_saved_forest_maps_back_with_the_same_predictions(tmp_path):
+    model, X = fitted_forest()
+    path = tmp_path / "forest.npy"
+    FlatForest.from_estimator(model).save(path)
+
+    nodes = np.load(path, mmap_mode="r", allow_pickle=False)
+    mapped = FlatForest(nodes, tree_roots(nodes))
+    assert isinstance(mapped.nodes, np.memmap)
+    assert len(mapped.roots) == 15
+    np.testing.assert_allclose(mapped.predict(X), model.predict(X), rtol=1e-9)
@@ -0,0 +1,60 @@
+import time
+
+import numpy as np
+import pytest
+
+from blueprints.ML.model_registry import ModelNotReady, ModelRegistry, resident_bytes
+
+
+def failing_registry(tmp_path, calls, retry_interval):
+    def trainer(current, incremental):
+        calls.append(incremental)
+        raise ValueError("No consecutive completed months of data to train on")
+
+    return ModelRegistry(str(tmp_path), "model", trainer, retry_interval=retry_interval)
+
+
+def test_failed_training_is_not_retried_on_every_request(tmp_path):
+    calls = []
+    registry = failing_registry(tmp_path, calls, retry_interval=300)
+
+    with pytest.raises(ModelNotReady, match="being trained"):
+        registry.get()
+    registry._training.join()
+
+    for _ in range(5):
+        with pytest.raises(ModelNotReady, match="No consecutive completed months"):
+            registry.get()
+    assert calls == [False]
+    assert registry.status()["last_error"] == "No consecutive completed months of data to train on"
+
+
+def test_training_is_retried_after_the_interval(tmp_path):
+    calls = []
+    registry = failing_registry(tmp_path, calls, retry_interval=0)
+
+    with pytest.raises(ModelNotReady):
+        registry.get()
+    registry._training.join()
+    with pytest.raises(ModelNotReady, match="being trained"):
+        registry.get()
+    registry._training.join()
+    assert calls == [False, False]
+
+
+def test_run_records_its_own_peak_memory(tmp_path):
+    # An earlier, larger allocation must not show up as this run's peak
+    spike = np.ones(256 * 2**20 // 8)
+    del spike
+    before = resident_bytes()
+
+    def trainer(current, incremental):
+        working_set = np.ones(32 * 2**20 // 8)
+        time.sleep(0.2)
+        raise ValueError(f"gave up after {working_set.nbytes} bytes")
+
+    registry = ModelRegistry(str(tmp_path), "model", trainer)
+    with pytest.raises(ValueError):
+        registry.train()
+    peak = registry.runs()[-1]["peak_memory_bytes"]
+    assert before + 24 * 2**20 <= peak < before + 128 * 2**20
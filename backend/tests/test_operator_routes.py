@@ -0,0 +1,13 @@
+from conftest import OPERATOR_HEADERS, PROFILE_HEADERS
+
+
+def test_stats_routes_need_the_operator_token(client):
+    for path in ("/api/v1.0/sql-stats", "/api/v1.0/cache-stats", "/api/v1.0/model"):
+        assert client.get(path).status_code == 403
+        assert client.get(path, headers=PROFILE_HEADERS).status_code == 403
+        assert client.get(path, headers=OPERATOR_HEADERS).status_code == 200
+
+
+def test_profile_routes_need_the_profile_token(client):
+    assert client.get("/api/v1.0/profiles", headers=OPERATOR_HEADERS).status_code == 403
+    assert client.get("/api/v1.0/profiles", headers=PROFILE_HEADERS).status_code == 200
@@ -0,0 +1,127 @@
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+
+import outbox
+from globals import pool, storage
+
+
+class FakeSMTP:
+    """Stand-in SMTP session; ``failures`` are raised by the next sendmail calls, in order"""
+
+    def __init__(self, mailbox, failures):
+        self.mailbox = mailbox
+        self.failures = failures
+
+    def sendmail(self, sender, recipient, message):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.mailbox.append(recipient)
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def mail(app):
+    """(make_sender, enqueue, row) over an emptied email_outbox"""
+    with pool.connection() as conn:
+        with storage.transaction(conn) as cursor:
+            cursor.execute("DELETE FROM email_outbox")
+
+    def make_sender(mailbox, failures=(), **options):
+        failures = list(failures)
+        return outbox.OutboxSender(pool, connect=lambda: FakeSMTP(mailbox, failures), sender="app@example.com", **options)
+
+    def enqueue(recipient):
+        with pool.connection() as conn:
+            with storage.transaction(conn) as cursor:
+                return outbox.enqueue(cursor, recipient, "Subject", "Body")
+
+    def row(message_id):
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT attempts, next_attempt_at, sent_at, last_error FROM email_outbox WHERE id = ?", (message_id,))
+            return cursor.fetchone()
+
+    return make_sender, enqueue, row
+
+
+def test_claimed_messages_are_leased_to_one_sender(mail):
+    make_sender, enqueue, row = mail
+    ids = [enqueue("a@example.com"), enqueue("b@example.com")]
+    first, second = make_sender([], lease_seconds=120), make_sender([])
+
+    with pool.connection() as conn:
+        claimed = first._claim(conn)
+        assert sorted(message[0] for message in claimed) == sorted(ids)
+        assert second._claim(conn) == []
+    assert all(row(message_id)[1] > datetime.utcnow() + timedelta(seconds=100) for message_id in ids)
+
+
+def test_due_messages_are_sent_once(mail):
+    make_sender, enqueue, row = mail
+    message_id = enqueue("a@example.com")
+    mailbox = []
+    sender = make_sender(mailbox)
+
+    assert sender.send_due() == 1
+    assert sender.send_due() == 0
+    assert mailbox == ["a@example.com"]
+    attempts, _, sent_at, last_error = row(message_id)
+    assert (attempts, last_error) == (1, None) and sent_at is not None
+
+
+def test_failures_back_off_until_max_attempts(mail):
+    make_sender, enqueue, row = mail
+    message_id = enqueue("a@example.com")
+    refusal = smtplib.SMTPResponseException(451, b"Try again later")
+    sender = make_sender([], failures=[refusal, refusal], backoff_base=30, max_attempts=2)
+
+    assert sender.send_due() == 1
+    attempts, next_attempt_at, sent_at, last_error = row(message_id)
+    assert (attempts, sent_at) == (1, None) and "Try again later" in last_error
+    # 30s with +-20% jitter
+    delay = (next_attempt_at - datetime.utcnow()).total_seconds()
+    assert 20 < delay <= 36
+    assert sender.send_due() == 0
+
+    with pool.connection() as conn:
+        with storage.transaction(conn) as cursor:
+            cursor.execute("UPDATE email_outbox SET next_attempt_at = ? WHERE id = ?", (datetime.utcnow(), message_id))
+    assert sender.send_due() == 1
+    assert row(message_id)[0] == 2
+    assert sender.stats()["dead"] == 1
+    # Out of attempts: never claimed again
+    with pool.connection() as conn:
+        with storage.transaction(conn) as cursor:
+            cursor.execute("UPDATE email_outbox SET next_attempt_at = ? WHERE id = ?", (datetime.utcnow(), message_id))
+    assert sender.send_due() == 0
+
+
+def test_dropped_session_is_reconnected(mail):
+    make_sender, enqueue, row = mail
+    enqueue("a@example.com")
+    mailbox = []
+    sender = make_sender(mailbox, failures=[smtplib.SMTPServerDisconnected("idle timeout")])
+
+    assert sender.send_due() == 1
+    assert mailbox == ["a@example.com"]
+    assert sender.connects == 2
+    assert sender.stats()["sent"] == 1
+
+
+def test_failed_connect_is_retried_later(mail):
+    make_sender, enqueue, row = mail
+    message_id = enqueue("a@example.com")
+
+    def refuse():
+        raise OSError("Connection refused")
+
+    sender = outbox.OutboxSender(pool, connect=refuse, sender="app@example.com")
+    assert sender.send_due() == 1
+    attempts, next_attempt_at, sent_at, last_error = row(message_id)
+    assert (attempts, sent_at, last_error) == (1, None, "Connection refused")
+    assert next_attempt_at > datetime.utcnow()
+    assert sender.connects == 0
@@ -0,0 +1,47 @@
+def test_cursor_walks_every_row_once_newest_first(client, user):
+    username, tokens, headers = user
+    rows = [{"description": "Dinner", "amount": i + 1, "category": "Dining", "date": f"2025-0{1 + i % 3}-15 12:00:00"} for i in range(23)]
+    assert client.post("/api/v1.0/expenses/bulk", headers=headers, json=rows).status_code == 201
+
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        query = {"ps": 10}
+        if cursor:
+            query["cursor"] = cursor
+        response = client.get("/api/v1.0/expenses", headers=headers, query_string=query)
+        assert response.status_code == 200
+        seen.extend(response.get_json())
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            assert "Link" not in response.headers
+            break
+        assert 'rel="next"' in response.headers["Link"]
+
+    assert pages == 3
+    assert len(seen) == 23
+    assert len({row["id"] for row in seen}) == 23
+    # Ties on date (several rows share each timestamp) are broken by id
+    keys = [(row["date"], row["id"]) for row in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_cursor_is_stable_across_inserts(client, user):
+    username, tokens, headers = user
+    rows = [{"description": "Movie", "amount": 1, "category": "Entertainment", "date": f"2025-02-{10 + i} 09:00:00"} for i in range(6)]
+    client.post("/api/v1.0/expenses/bulk", headers=headers, json=rows)
+
+    first = client.get("/api/v1.0/expenses", headers=headers, query_string={"ps": 3})
+    # A newer row must not shift the next page
+    client.post("/api/v1.0/expenses", headers=headers, data={"description": "Movie", "amount": "2", "category": "Entertainment"})
+    second = client.get("/api/v1.0/expenses", headers=headers, query_string={"ps": 3, "cursor": first.headers["X-Next-Cursor"]})
+
+    assert [row["date"][:10] for row in second.get_json()] == ["2025-02-12", "2025-02-11", "2025-02-10"]
+
+
+def test_invalid_cursor_is_rejected(client, user):
+    username, tokens, headers = user
+    response = client.get("/api/v1.0/expenses", headers=headers, query_string={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
@@ -0,0 +1,49 @@
+import pstats
+
+from conftest import OPERATOR_HEADERS, PROFILE_HEADERS
+from profiling import request_profiler
+
+
+def test_only_the_profile_token_profiles_a_request(client):
+    assert "X-Profile-Id" not in client.get("/ready").headers
+    assert "X-Profile-Id" not in client.get("/ready", headers={"X-Profile": "wrong"}).headers
+
+    response = client.get("/ready", headers=PROFILE_HEADERS)
+    assert response.status_code == 200
+    assert response.headers["X-Profile-Id"] in [p["id"] for p in request_profiler.list()]
+
+
+def test_sampled_requests_are_profiled_except_operator_routes(client, monkeypatch):
+    monkeypatch.setattr(request_profiler, "sample_rate", 1.0)
+    response = client.get("/ready")
+    details = client.get(f"/api/v1.0/profiles/{response.headers['X-Profile-Id']}", headers=PROFILE_HEADERS).get_json()
+    assert (details["path"], details["requested"], details["status"]) == ("/ready", False, 200)
+
+    assert "X-Profile-Id" not in client.get("/api/v1.0/sql-stats", headers=OPERATOR_HEADERS).headers
+    assert "X-Profile-Id" not in client.get("/api/v1.0/profiles", headers=PROFILE_HEADERS).headers
+
+
+def test_only_the_newest_profiles_are_kept(client, monkeypatch):
+    monkeypatch.setattr(request_profiler, "keep", 2)
+    ids = [client.get("/ready", headers=PROFILE_HEADERS).headers["X-Profile-Id"] for _ in range(3)]
+
+    listed = [p["id"] for p in client.get("/api/v1.0/profiles", headers=PROFILE_HEADERS).get_json()]
+    assert listed == ids[:0:-1]
+    assert client.get(f"/api/v1.0/profiles/{ids[0]}", headers=PROFILE_HEADERS).status_code == 404
+
+
+def test_profile_downloads(client, tmp_path):
+    profile_id = client.get("/ready", headers=PROFILE_HEADERS).headers["X-Profile-Id"]
+
+    details = client.get(f"/api/v1.0/profiles/{profile_id}", headers=PROFILE_HEADERS).get_json()
+    assert details["endpoint"] == "ready" and "cumulative" in details["top_functions"]
+
+    response = client.get(f"/api/v1.0/profiles/{profile_id}?kind=prof", headers=PROFILE_HEADERS)
+    assert response.status_code == 200
+    assert response.headers["Content-Disposition"] == f"attachment; filename={profile_id}.prof"
+    (tmp_path / "run.prof").write_bytes(response.data)
+    assert pstats.Stats(str(tmp_path / "run.prof")).total_calls > 0
+
+    assert client.get(f"/api/v1.0/profiles/{profile_id}?kind=tracemalloc", headers=PROFILE_HEADERS).status_code == 404
+    assert client.get(f"/api/v1.0/profiles/{profile_id}?kind=py", headers=PROFILE_HEADERS).status_code == 404
+    assert client.get("/api/v1.0/profiles/..%2Fsecrets", headers=PROFILE_HEADERS).status_code == 404
@@ -0,0 +1,78 @@
+import rollups
+from blueprints.ML.forecast_api import forget_forecasts
+from conftest import register_user
+from decorators import cache_key, uses_model
+from globals import storage
+from response_cache import response_cache
+
+
+def test_etag_revalidates_until_a_write(client, user):
+    username, tokens, headers = user
+    first = client.get("/api/v1.0/budgets", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    response = client.get("/api/v1.0/budgets", headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 304
+
+    assert client.post("/api/v1.0/budgets", headers=headers, json={"category": "Groceries", "monthly_limit": 80}).status_code == 201
+    response = client.get("/api/v1.0/budgets", headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert [budget["category"] for budget in response.get_json()] == ["Groceries"]
+
+
+def test_write_from_another_worker_invalidates(client, conn, user):
+    username, tokens, headers = user
+    first = client.get("/api/v1.0/account_balance", headers=headers)
+    etag = first.headers["ETag"]
+
+    # Another process writing the same database: nothing in this process is told about it
+    with storage.transaction(conn) as cursor:
+        cursor.execute("INSERT INTO salaries (id, name, amount, date, username) VALUES ('other-worker', 'Bonus', 250, '2025-03-01 00:00:00', ?)", (username,))
+        rollups.record(cursor, username, rollups.INCOME, None, "2025-03-01", 250)
+
+    response = client.get("/api/v1.0/account_balance", headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 200
+    assert response.get_json()["total_income"] == 250.0
+
+
+def test_etag_depends_on_path_parameters(client, user):
+    username, tokens, headers = user
+    ids = [
+        client.post("/api/v1.0/expenses", headers=headers, data={"description": "Dinner", "amount": str(n), "category": "Dining"}).get_json()["id"]
+        for n in (1, 2)
+    ]
+    first = client.get(f"/api/v1.0/expenses/{ids[0]}", headers=headers)
+    response = client.get(f"/api/v1.0/expenses/{ids[1]}", headers=dict(headers, **{"If-None-Match": first.headers["ETag"]}))
+    assert response.status_code == 200
+    assert response.get_json()["amount"] == 2.0
+
+
+def test_model_swap_only_retires_model_keys(app, monkeypatch):
+    monkeypatch.setattr(response_cache, "model_version", "v1")
+
+    @uses_model
+    def forecast_view():
+        pass
+
+    def list_view():
+        pass
+
+    with app.test_request_context("/api/v1.0/anything"):
+        forecast_key, list_key = cache_key("someone", forecast_view), cache_key("someone", list_view)
+        forget_forecasts({"version": "v2"})
+        assert cache_key("someone", forecast_view) != forecast_key
+        assert cache_key("someone", list_view) == list_key
+        assert response_cache.etag(cache_key("someone", list_view), 3) == response_cache.etag(list_key, 3)
+
+
+def test_users_never_share_an_etag(client, user):
+    username, tokens, headers = user
+    other, other_tokens, other_headers = register_user(client)
+
+    mine = client.get("/api/v1.0/budgets", headers=headers)
+    theirs = client.get("/api/v1.0/budgets", headers=dict(other_headers, **{"If-None-Match": mine.headers["ETag"]}))
+    assert theirs.status_code == 200
+    assert theirs.headers["ETag"] != mine.headers["ETag"]
+    assert "x-access-token" in theirs.headers["Vary"].lower()
@@ -0,0 +1,36 @@
+import rollups
+from conftest import add_expense
+
+
+def rollup_totals(conn, username, kind):
+    cursor = conn.cursor()
+    cursor.execute("SELECT SUM(total), SUM(entries) FROM monthly_rollups WHERE username = ? AND kind = ?", (username, kind))
+    return tuple(float(v or 0) for v in cursor.fetchone())
+
+
+def test_rollups_follow_expense_writes(client, conn, user):
+    username, tokens, headers = user
+    first = add_expense(client, headers, 12)
+    second = add_expense(client, headers, 30)
+    client.put(f"/api/v1.0/expenses/{first}", headers=headers, data={"description": "Dinner", "amount": "20", "category": "Dining"})
+    client.delete(f"/api/v1.0/expenses/{second}", headers=headers)
+    client.post("/api/v1.0/expenses/bulk", headers=headers, json=[
+        {"description": "Movie", "amount": 9, "category": "Entertainment", "date": "2025-01-05"},
+    ])
+
+    assert rollup_totals(conn, username, rollups.EXPENSE) == (29.0, 2.0)
+    cursor = conn.cursor()
+    cursor.execute("SELECT total FROM monthly_rollups WHERE username = ? AND month = '2025-01' AND category = 'Entertainment'", (username,))
+    assert float(cursor.fetchone()[0]) == 9.0
+
+
+def test_rebuild_matches_incremental_rollups(client, conn, user):
+    username, tokens, headers = user
+    add_expense(client, headers, 11)
+    client.post("/api/v1.0/salaries", headers=headers, data={"name": "Salary", "amount": "500"})
+    expenses, income = rollup_totals(conn, username, rollups.EXPENSE), rollup_totals(conn, username, rollups.INCOME)
+
+    rollups.rebuild(conn)
+
+    assert rollup_totals(conn, username, rollups.EXPENSE) == expenses
+    assert rollup_totals(conn, username, rollups.INCOME) == income
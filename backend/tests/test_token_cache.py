@@ -0,0 +1,39 @@
+import time
+
+from token_cache import RevocationCache, VerifiedTokenCache
+
+
+def test_revocation_reload_keeps_concurrent_adds():
+    cache = RevocationCache()
+    now = time.time()
+    cache.add("added-meanwhile", now + 60)
+    cache.load([("from-db", now + 60), ("expired", now - 1)])
+    assert "added-meanwhile" in cache
+    assert "from-db" in cache
+    assert "expired" not in cache
+    assert len(cache) == 2
+
+
+def test_revocations_drop_out_at_expiry():
+    cache = RevocationCache()
+    cache.add("short", time.time() + 0.05)
+    assert "short" in cache
+    time.sleep(0.1)
+    assert "short" not in cache
+    assert len(cache) == 0
+
+
+def test_claim_refresh_is_granted_once_per_interval():
+    cache = RevocationCache(refresh_interval=60)
+    assert cache.claim_refresh()
+    assert not cache.claim_refresh()
+    cache.load([])
+    assert not cache.claim_refresh()
+
+
+def test_verified_tokens_forget_expired_claims():
+    cache = VerifiedTokenCache(maxsize=2)
+    cache.put("a", {"exp": time.time() + 60})
+    cache.put("b", {"exp": time.time() - 1})
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
@@ -0,0 +1,66 @@
+import pytest
+
+import rollups
+from blueprints.ML import training
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def rollup_conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(training, "TREES_PER_CHUNK", 5)
+    storage = SQLiteStorage(str(tmp_path / "training.db"))
+    conn = storage.connect()
+    storage.bootstrap(conn)
+    yield conn
+    conn.close()
+
+
+def add_months(conn, username, months):
+    cursor = conn.cursor()
+    for i, month in enumerate(months):
+        cursor.execute(
+            "INSERT INTO monthly_rollups (username, month, kind, category, total, entries) VALUES (?, ?, ?, '', ?, 1)",
+            (username, month, rollups.INCOME, 1000 + i)
+        )
+        cursor.execute(
+            "INSERT INTO monthly_rollups (username, month, kind, category, total, entries) VALUES (?, ?, ?, 'Dining', ?, 1)",
+            (username, month, rollups.EXPENSE, 400 + i)
+        )
+    conn.commit()
+
+
+def test_current_month_is_left_out(rollup_conn, monkeypatch):
+    monkeypatch.setattr(training, "current_month", lambda: "2026-10")
+    add_months(rollup_conn, "ann", ["2026-06", "2026-07", "2026-08", "2026-09", "2026-10"])
+    add_months(rollup_conn, "bob", ["2026-08", "2026-09", "2026-10"])
+
+    model, metadata = training.train(rollup_conn)
+
+    assert metadata["mode"] == "full"
+    assert metadata["trained_through"] == "2026-09"
+    # ann: 07, 08, 09 as targets; bob: 09
+    assert metadata["training_rows"] == 4
+
+
+def test_incremental_run_picks_up_the_month_once_it_closes(rollup_conn, monkeypatch):
+    add_months(rollup_conn, "ann", ["2026-07", "2026-08", "2026-09", "2026-10"])
+    monkeypatch.setattr(training, "current_month", lambda: "2026-10")
+    current = training.train(rollup_conn)
+
+    with pytest.raises(ValueError, match="No months completed after 2026-09"):
+        training.train(rollup_conn, current, incremental=True)
+
+    monkeypatch.setattr(training, "current_month", lambda: "2026-11")
+    model, metadata = training.train(rollup_conn, current, incremental=True)
+    assert metadata["mode"] == "incremental"
+    assert metadata["new_rows"] == 1
+    assert metadata["training_rows"] == 3
+    assert metadata["trained_through"] == "2026-10"
+    assert len(model.estimators_) > len(current[0].estimators_)
+
+
+def test_no_completed_pairs_is_an_error(rollup_conn, monkeypatch):
+    monkeypatch.setattr(training, "current_month", lambda: "2026-10")
+    add_months(rollup_conn, "ann", ["2026-09", "2026-10"])
+    with pytest.raises(ValueError, match="No consecutive completed months"):
+        training.train(rollup_conn)
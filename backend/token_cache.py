@@ -0,0 +1,192 @@
+import calendar
+import hashlib
+import heapq
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+import jwt
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationCache:
+    """In-memory copy of the revoked_tokens table, keyed by token id (jti).
+
+    Each id is kept only until its token's ``exp``; after that the JWT check
+    rejects the token anyway. The whole set is reloaded from the database every
+    ``refresh_interval`` seconds so logouts handled by other worker processes
+    are picked up; a reload is merged into what is cached, so an ``add`` that
+    races the database read is not lost.
+    """
+
+    def __init__(self, refresh_interval=30):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._expiry_heap = []
+        self._loaded_at = None
+        self._refreshing = False
+
+    def load(self, entries):
+        fetched = dict(entries)
+        with self._lock:
+            now = time.time()
+            tokens = {jti: exp for jti, exp in {**self._tokens, **fetched}.items() if exp > now}
+            heap = [(exp, jti) for jti, exp in tokens.items()]
+            heapq.heapify(heap)
+            self._tokens = tokens
+            self._expiry_heap = heap
+            self._loaded_at = time.monotonic()
+            self._refreshing = False
+
+    def add(self, jti, exp):
+        with self._lock:
+            self._tokens[jti] = exp
+            heapq.heappush(self._expiry_heap, (exp, jti))
+
+    def claim_refresh(self):
+        """True for exactly one caller once the cached set is due for a reload"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+                return False
+            self._refreshing = True
+            return True
+
+    def release_refresh(self):
+        with self._lock:
+            self._refreshing = False
+
+    def _evict_expired(self, now):
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            exp, jti = heapq.heappop(heap)
+            if self._tokens.get(jti) == exp:
+                del self._tokens[jti]
+
+    def __contains__(self, jti):
+        with self._lock:
+            self._evict_expired(time.time())
+            return jti in self._tokens
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tokens)
+
+
+class VerifiedTokenCache:
+    """Small LRU of tokens whose HS256 signature has already been checked"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, token):
+        with self._lock:
+            claims = self._entries.get(token)
+            if claims is None:
+                return None
+            if claims.get('exp', 0) <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return claims
+
+    def put(self, token, claims):
+        with self._lock:
+            self._entries[token] = claims
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+
+def token_id(claims, token):
+    """Fixed-width revocation key: the jti claim, or a digest for tokens issued without one"""
+    return claims.get('jti') or hashlib.sha256(token.encode('utf-8')).hexdigest()[:32]
+
+
+def to_epoch(value):
+    return calendar.timegm(value.utctimetuple())
+
+
+def fetch_revoked_tokens(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > ?", (datetime.utcnow(),))
+    return [(jti, to_epoch(expires_at)) for jti, expires_at in cursor.fetchall()]
+
+
+def migrate_legacy_blacklist(conn, integrity_error):
+    """Move still-valid tokens from the pre-jti ``blacklist`` table into revoked_tokens.
+
+    Logouts before revoked_tokens existed stored the whole token string.
+    Each one that has not expired yet is keyed by its digest, like any
+    token without a jti; migrated and expired rows are deleted, so the
+    table empties as it is drained. Does nothing when there is no
+    ``blacklist`` table. Returns how many tokens were migrated.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT token FROM blacklist")
+        tokens = [row[0] for row in cursor.fetchall()]
+    except Exception:
+        conn.rollback()
+        return 0
+
+    now = time.time()
+    migrated = 0
+    for token in tokens:
+        try:
+            # Only our own logout handler ever wrote these rows; exp is all that is needed
+            claims = jwt.decode(token, options={"verify_signature": False, "verify_exp": False})
+            exp = int(claims['exp'])
+        except (jwt.InvalidTokenError, KeyError, TypeError, ValueError):
+            exp = None
+        if exp is not None and exp > now:
+            try:
+                cursor.execute(
+                    "INSERT INTO revoked_tokens (jti, expires_at) VALUES (?, ?)",
+                    (token_id(claims, token), datetime.utcfromtimestamp(exp))
+                )
+                migrated += 1
+            except integrity_error:
+                pass  # already migrated
+        cursor.execute("DELETE FROM blacklist WHERE token = ?", (token,))
+    conn.commit()
+    if tokens:
+        logger.info("Migrated %d of %d legacy blacklist tokens to revoked_tokens", migrated, len(tokens))
+    return migrated
+
+
+def purge_expired_revocations(conn):
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (datetime.utcnow(),))
+    conn.commit()
+    return cursor.rowcount
+
+
+def start_revocation_purger(pool, interval=3600):
+    """Daemon thread deleting revoked_tokens rows whose tokens have expired"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with pool.connection() as conn:
+                    purge_expired_revocations(conn)
+            except Exception as e:
+                logger.warning("Revoked token purge failed: %s", e)
+
+    thread = threading.Thread(target=run, name="revocation-purger", daemon=True)
+    thread.start()
+    return thread
+
+
+revoked_tokens = RevocationCache()
+verified_tokens = VerifiedTokenCache()